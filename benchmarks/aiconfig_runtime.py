@@ -0,0 +1,59 @@
+"""Compares loading an AI Config runtime from disk with getting it from the pool.
+
+python -m benchmarks.aiconfig_runtime --iterations 200
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.stats import print_summary
+
+CONFIG_FILE_PATH = Path("config/auto-reply-content-gen.aiconfig.json")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--config", type=Path, default=CONFIG_FILE_PATH)
+    args = parser.parse_args()
+
+    # Importing aiconfig registers all model parsers, which dominates startup.
+    started_at = time.perf_counter()
+    from aiconfig import AIConfigRuntime
+    from roll.models import AIConfigRuntimePool
+
+    import_time = time.perf_counter() - started_at
+
+    timings: Dict[str, List[float]] = {"load": [], "cold": [], "cached": []}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_file_path = Path(tmp_dir) / args.config.name
+        shutil.copyfile(src=args.config, dst=config_file_path)
+
+        for _ in range(args.iterations):
+            started_at = time.perf_counter()
+            AIConfigRuntime.load(str(config_file_path))
+            timings["load"].append(time.perf_counter() - started_at)
+
+        pool = AIConfigRuntimePool()
+        for _ in range(args.iterations):
+            pool.clear()
+            started_at = time.perf_counter()
+            pool.acquire(config_file_path)
+            timings["cold"].append(time.perf_counter() - started_at)
+
+        pool.acquire(config_file_path)
+        for _ in range(args.iterations):
+            started_at = time.perf_counter()
+            pool.acquire(config_file_path)
+            timings["cached"].append(time.perf_counter() - started_at)
+
+    print(f"Import time: {import_time * 1000:.1f}ms")
+    print_summary(timings)
+
+
+if __name__ == "__main__":
+    main()
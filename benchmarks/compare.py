@@ -0,0 +1,90 @@
+"""Compares two result files of benchmarks.suite and flags regressions.
+
+    python -m benchmarks.compare before.json after.json --threshold 0.2
+
+Exits with status 1 if the p95 latency or peak memory of any benchmark grew by
+more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+ResultKey = Tuple[str, Optional[int]]
+
+
+def load_results(path: Path) -> Dict[ResultKey, Dict[str, Any]]:
+    """Loads the results of a suite run, keyed by benchmark name and size."""
+    report = json.loads(path.read_text())
+    return {(r["name"], r["size"]): r for r in report["results"]}
+
+
+def get_change(before: float, after: float) -> float:
+    """Returns the relative change from before to after."""
+    if before == 0:
+        return 0.0 if after == 0 else float("inf")
+    return (after - before) / before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="The relative increase that counts as a regression.",
+    )
+    parser.add_argument(
+        "--min-memory-increase",
+        type=int,
+        default=1024 * 1024,
+        help="The increase in bytes below which memory changes are noise.",
+    )
+    args = parser.parse_args()
+
+    before = load_results(args.before)
+    after = load_results(args.after)
+
+    print(
+        f"{'benchmark':<28} {'size':>7} {'items/s':>9} {'p50':>9} {'p95':>9} "
+        f"{'peak mem':>9}"
+    )
+    n_regressions = 0
+    for key in sorted(before.keys() & after.keys(), key=lambda k: (k[0], k[1] or 0)):
+        old, new = before[key], after[key]
+        changes = {
+            "throughput": get_change(old["throughput"], new["throughput"]),
+            "p50_ms": get_change(old["p50_ms"], new["p50_ms"]),
+            "p95_ms": get_change(old["p95_ms"], new["p95_ms"]),
+            "peak_memory_bytes": get_change(
+                old["peak_memory_bytes"], new["peak_memory_bytes"]
+            ),
+        }
+        memory_increase = new["peak_memory_bytes"] - old["peak_memory_bytes"]
+        regressed = changes["p95_ms"] > args.threshold or (
+            changes["peak_memory_bytes"] > args.threshold
+            and memory_increase > args.min_memory_increase
+        )
+        n_regressions += regressed
+        name, size = key
+        print(
+            f"{name:<28} {'' if size is None else size:>7} "
+            + " ".join(f"{change:>+8.0%}" for change in changes.values())
+            + ("  REGRESSION" if regressed else "")
+        )
+
+    for key in sorted(before.keys() ^ after.keys(), key=lambda k: (k[0], k[1] or 0)):
+        where = "before" if key in before else "after"
+        print(f"{key[0]} (size={key[1]}) only ran {where}.")
+
+    if n_regressions > 0:
+        print(f"{n_regressions} regressions above {args.threshold:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
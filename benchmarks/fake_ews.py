@@ -0,0 +1,281 @@
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Dict, List, Optional, Type
+
+SOAP_NS = "http://schemas.xmlsoap.org/soap/envelope/"
+MESSAGES_NS = "http://schemas.microsoft.com/exchange/services/2006/messages"
+TYPES_NS = "http://schemas.microsoft.com/exchange/services/2006/types"
+
+EWS_PATH = "/EWS/Exchange.asmx"
+
+
+def _tag(ns: str, name: str) -> str:
+    return f"{{{ns}}}{name}"
+
+
+def _format_datetime(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@dataclass
+class FakeOofState:
+    """Represents the out-of-office settings stored by the fake server."""
+
+    state: str = "Disabled"
+    external_audience: str = "All"
+    start: datetime = field(default_factory=lambda: datetime.now(tz=timezone.utc))
+    end: datetime = field(
+        default_factory=lambda: datetime.now(tz=timezone.utc) + timedelta(days=1)
+    )
+    internal_reply: str = ""
+    external_reply: str = ""
+
+
+class FakeEwsServer:
+    """Represents a local stand-in for an Exchange Web Services endpoint.
+
+    The server answers the requests exchangelib sends when it connects to an
+    explicit service endpoint (auth type and version probing) as well as
+    GetUserOofSettings and SetUserOofSettings. Every request can be delayed and
+    made to fail to simulate a slow or unreliable Exchange server.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        operation_latency: Optional[Dict[str, float]] = None,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """Initializes a new instance of the FakeEwsServer class.
+
+        Args:
+            latency (float, optional): The delay in seconds added to every request. Defaults to 0.0.
+            operation_latency (Optional[Dict[str, float]], optional): Extra delay in seconds per
+                operation name, e.g. `{"SetUserOofSettings": 0.5}`. Defaults to None.
+            failure_rate (float, optional): The probability that a request fails with
+                HTTP 500. Defaults to 0.0.
+            seed (Optional[int], optional): The seed used for injecting failures. Defaults to None.
+            host (str, optional): The host to bind to. Defaults to "127.0.0.1".
+            port (int, optional): The port to bind to. Defaults to 0 (any free port).
+        """
+        self.latency = latency
+        self.operation_latency: Dict[str, float] = dict(operation_latency or {})
+        self.failure_rate = failure_rate
+        self.oof = FakeOofState()
+        self.requests: List[str] = []
+        self._random = random.Random(seed)
+        self._failures_left: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def service_endpoint(self) -> str:
+        """Return the URL of the EWS endpoint."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host!s}:{port}{EWS_PATH}"
+
+    def fail_next(self, operation: str, count: int = 1) -> None:
+        """Make the next requests for the given operation fail.
+
+        Args:
+            operation (str): The operation name, e.g. "SetUserOofSettings".
+            count (int, optional): The number of requests to fail. Defaults to 1.
+        """
+        with self._lock:
+            self._failures_left[operation] = count
+
+    def start(self) -> None:
+        """Starts serving requests in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the server."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "FakeEwsServer":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def _should_fail(self, operation: str) -> bool:
+        with self._lock:
+            failures_left = self._failures_left.get(operation, 0)
+            if failures_left > 0:
+                self._failures_left[operation] = failures_left - 1
+                return True
+            return self._random.random() < self.failure_rate
+
+    def _handle(self, body: bytes) -> bytes:
+        envelope = ET.fromstring(body)
+        request = envelope.find(f"{_tag(SOAP_NS, 'Body')}/*")
+        if request is None:
+            raise ValueError("SOAP body is empty")
+        operation = request.tag.split("}")[-1].removesuffix("Request")
+        with self._lock:
+            self.requests.append(operation)
+
+        time.sleep(self.latency + self.operation_latency.get(operation, 0.0))
+        if self._should_fail(operation):
+            raise RuntimeError(f"Injected failure for {operation}")
+
+        if operation == "GetUserOofSettings":
+            response = self._get_user_oof_settings()
+        elif operation == "SetUserOofSettings":
+            response = self._set_user_oof_settings(request=request)
+        else:
+            response = self._unsupported(operation=operation)
+        return self._envelope(response)
+
+    def _get_user_oof_settings(self) -> ET.Element:
+        response = ET.Element(_tag(MESSAGES_NS, "GetUserOofSettingsResponse"))
+        response.append(self._response_message())
+        settings = ET.SubElement(response, _tag(TYPES_NS, "OofSettings"))
+        ET.SubElement(settings, _tag(TYPES_NS, "OofState")).text = self.oof.state
+        ET.SubElement(settings, _tag(TYPES_NS, "ExternalAudience")).text = (
+            self.oof.external_audience
+        )
+        duration = ET.SubElement(settings, _tag(TYPES_NS, "Duration"))
+        ET.SubElement(duration, _tag(TYPES_NS, "StartTime")).text = _format_datetime(
+            self.oof.start
+        )
+        ET.SubElement(duration, _tag(TYPES_NS, "EndTime")).text = _format_datetime(
+            self.oof.end
+        )
+        for name, text in [
+            ("InternalReply", self.oof.internal_reply),
+            ("ExternalReply", self.oof.external_reply),
+        ]:
+            reply = ET.SubElement(settings, _tag(TYPES_NS, name))
+            ET.SubElement(reply, _tag(TYPES_NS, "Message")).text = text
+        ET.SubElement(response, _tag(MESSAGES_NS, "AllowExternalOof")).text = "All"
+        return response
+
+    def _set_user_oof_settings(self, request: ET.Element) -> ET.Element:
+        settings = request.find(_tag(TYPES_NS, "UserOofSettings"))
+        if settings is None:
+            raise ValueError("UserOofSettings is missing")
+
+        def find_text(path: str) -> str:
+            elem = settings.find(path)
+            return "" if elem is None or elem.text is None else elem.text
+
+        t = f"{{{TYPES_NS}}}"
+        with self._lock:
+            self.oof.state = find_text(f"{t}OofState")
+            self.oof.external_audience = find_text(f"{t}ExternalAudience") or "All"
+            start = find_text(f"{t}Duration/{t}StartTime")
+            end = find_text(f"{t}Duration/{t}EndTime")
+            if start and end:
+                self.oof.start = datetime.fromisoformat(start)
+                self.oof.end = datetime.fromisoformat(end)
+            self.oof.internal_reply = find_text(f"{t}InternalReply/{t}Message")
+            self.oof.external_reply = find_text(f"{t}ExternalReply/{t}Message")
+
+        response = ET.Element(_tag(MESSAGES_NS, "SetUserOofSettingsResponse"))
+        response.append(self._response_message())
+        return response
+
+    def _unsupported(self, operation: str) -> ET.Element:
+        # exchangelib guesses the server version with a dummy ConvertId request. It
+        # only needs the ServerVersionInfo header, so an error response will do.
+        response = ET.Element(_tag(MESSAGES_NS, f"{operation}Response"))
+        messages = ET.SubElement(response, _tag(MESSAGES_NS, "ResponseMessages"))
+        message = ET.SubElement(
+            messages,
+            _tag(MESSAGES_NS, f"{operation}ResponseMessage"),
+            ResponseClass="Error",
+        )
+        ET.SubElement(message, _tag(MESSAGES_NS, "MessageText")).text = (
+            f"{operation} is not supported by the fake server."
+        )
+        ET.SubElement(message, _tag(MESSAGES_NS, "ResponseCode")).text = (
+            "ErrorInvalidOperation"
+        )
+        ET.SubElement(message, _tag(MESSAGES_NS, "DescriptiveLinkKey")).text = "0"
+        return response
+
+    def _response_message(self) -> ET.Element:
+        message = ET.Element(
+            _tag(MESSAGES_NS, "ResponseMessage"), ResponseClass="Success"
+        )
+        ET.SubElement(message, _tag(MESSAGES_NS, "ResponseCode")).text = "NoError"
+        return message
+
+    def _envelope(self, response: ET.Element) -> bytes:
+        envelope = ET.Element(_tag(SOAP_NS, "Envelope"))
+        header = ET.SubElement(envelope, _tag(SOAP_NS, "Header"))
+        ET.SubElement(
+            header,
+            _tag(TYPES_NS, "ServerVersionInfo"),
+            MajorVersion="15",
+            MinorVersion="20",
+            MajorBuildNumber="7452",
+            MinorBuildNumber="0",
+            Version="V2018_01_08",
+        )
+        body = ET.SubElement(envelope, _tag(SOAP_NS, "Body"))
+        body.append(response)
+        return ET.tostring(envelope, encoding="utf-8", xml_declaration=True)
+
+    def _make_handler(self) -> Type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if self.path != EWS_PATH:
+                    self._reply(status=404, body=b"", content_type="text/plain")
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if "Authorization" not in self.headers:
+                    # Advertise basic auth so exchangelib sends credentials.
+                    self.send_response(401)
+                    self.send_header("WWW-Authenticate", 'Basic realm="fake-ews"')
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                try:
+                    response = server._handle(body)
+                except Exception as e:
+                    self._reply(
+                        status=500,
+                        body=str(e).encode("utf-8"),
+                        content_type="text/plain",
+                    )
+                    return
+                self._reply(status=200, body=response, content_type="text/xml")
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+            def _reply(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,105 @@
+import threading
+import time
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Type
+
+from aiconfig import AIConfigRuntime, InferenceOptions
+
+DEFAULT_MESSAGE = (
+    "Hej og tak for din e-mail!\n\n"
+    "Jeg er på ferie og læser ikke mine e-mails før jeg er tilbage. "
+    "I mellemtiden nyder jeg solen, en god bog og alt for mange kanelsnegle.\n\n"
+    "Venlig hilsen"
+)
+DEFAULT_DALL_E_PROMPT = "A watercolor of a cinnamon roll on a sunny beach"
+
+
+class FakeModel:
+    """Represents a local stand-in for the models behind the AI Config prompts.
+
+    While active, every prompt run by an AIConfigRuntime returns a fixed output
+    after a delay instead of calling a model. The delay blocks the calling thread
+    like the real model clients do. When streaming is requested, the message is
+    passed to the stream callback in chunks.
+    """
+
+    def __init__(
+        self,
+        image_url: str,
+        latency: float = 0.0,
+        prompt_latency: Optional[Dict[str, float]] = None,
+        message: str = DEFAULT_MESSAGE,
+        n_stream_chunks: int = 20,
+    ) -> None:
+        """Initializes a new instance of the FakeModel class.
+
+        Args:
+            image_url (str): The URL returned by the `generate-image` prompt.
+            latency (float, optional): The delay in seconds of every prompt. Defaults to 0.0.
+            prompt_latency (Optional[Dict[str, float]], optional): Extra delay in seconds per
+                prompt name, e.g. `{"generate-image": 5.0}`. Defaults to None.
+            message (str, optional): The message returned by the `generate-text` prompt.
+            n_stream_chunks (int, optional): The number of chunks the message is streamed
+                in. Defaults to 20.
+        """
+        self.image_url = image_url
+        self.latency = latency
+        self.prompt_latency: Dict[str, float] = dict(prompt_latency or {})
+        self.message = message
+        self.n_stream_chunks = n_stream_chunks
+        self.calls: List[str] = []
+        self._lock = threading.Lock()
+        self._original: Optional[Any] = None
+
+    def start(self) -> None:
+        """Replaces the model calls of AIConfigRuntime with the fake ones."""
+        fake = self
+
+        async def run_and_get_output_text(
+            runtime: AIConfigRuntime,
+            prompt_name: str,
+            params: Optional[Dict[str, Any]] = None,
+            options: Optional[InferenceOptions] = None,
+            **kwargs: Any,
+        ) -> str:
+            return fake._run(prompt_name=prompt_name, options=options)
+
+        self._original = AIConfigRuntime.run_and_get_output_text
+        AIConfigRuntime.run_and_get_output_text = run_and_get_output_text  # type: ignore
+
+    def stop(self) -> None:
+        """Restores the model calls of AIConfigRuntime."""
+        if self._original is not None:
+            AIConfigRuntime.run_and_get_output_text = self._original  # type: ignore
+            self._original = None
+
+    def __enter__(self) -> "FakeModel":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def _run(self, prompt_name: str, options: Optional[InferenceOptions]) -> str:
+        with self._lock:
+            self.calls.append(prompt_name)
+        time.sleep(self.latency + self.prompt_latency.get(prompt_name, 0.0))
+
+        if prompt_name == "generate-image":
+            return self.image_url
+        if prompt_name == "generate-dall-e-prompt":
+            return DEFAULT_DALL_E_PROMPT
+
+        if options is not None and options.stream and options.stream_callback:
+            chunk_size = max(1, len(self.message) // self.n_stream_chunks)
+            accumulated = ""
+            for i in range(0, len(self.message), chunk_size):
+                chunk = self.message[i : i + chunk_size]
+                accumulated += chunk
+                options.stream_callback({"content": chunk}, accumulated, 0)
+        return self.message
@@ -0,0 +1,107 @@
+import io
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Optional, Type
+
+from PIL import Image
+
+IMAGE_PATH = "/images/generated.png"
+
+
+def create_png(width: int, height: int) -> bytes:
+    """Creates a PNG of random pixels, which compresses as badly as a photo."""
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LocalImageServer:
+    """Represents a local stand-in for the CDN that serves generated images.
+
+    The server serves a single PNG of the size DALL-E generates by default.
+    Every request can be delayed to simulate a slow CDN.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        width: int = 1024,
+        height: int = 1024,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """Initializes a new instance of the LocalImageServer class.
+
+        Args:
+            latency (float, optional): The delay in seconds added to every request. Defaults to 0.0.
+            width (int, optional): The width of the image in pixels. Defaults to 1024.
+            height (int, optional): The height of the image in pixels. Defaults to 1024.
+            host (str, optional): The host to bind to. Defaults to "127.0.0.1".
+            port (int, optional): The port to bind to. Defaults to 0 (any free port).
+        """
+        self.latency = latency
+        self.image = create_png(width=width, height=height)
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def image_url(self) -> str:
+        """Return the URL of the image."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host!s}:{port}{IMAGE_PATH}"
+
+    def start(self) -> None:
+        """Starts serving requests in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the server."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "LocalImageServer":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def _make_handler(self) -> Type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.n_requests += 1
+                time.sleep(server.latency)
+                if self.path != IMAGE_PATH:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(server.image)))
+                self.end_headers()
+                self.wfile.write(server.image)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
@@ -0,0 +1,94 @@
+"""Times backing up and setting Outlook's out-of-office settings end to end.
+
+The benchmark talks to a local FakeEwsServer, so no Exchange tenant is needed:
+
+    python -m benchmarks.oof --iterations 20 --latency 0.05
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import anyio
+from roll.email import OutlookAutoReplyClient
+
+from benchmarks.fake_ews import FakeEwsServer
+from benchmarks.stats import print_summary
+
+HTML_CONTENT = "<html><body><p>Hej og tak for din e-mail!</p></body></html>"
+
+
+async def run_once(service_endpoint: str, output_dir: Path) -> Dict[str, float]:
+    """Runs backup and set once with a new client and returns the stage timings."""
+    timings: Dict[str, float] = {}
+
+    started_at = time.perf_counter()
+    client = OutlookAutoReplyClient(
+        login_name="benchmark",
+        password="benchmark",
+        account_name="benchmark@example.com",
+        service_endpoint=service_endpoint,
+    )
+    timings["connect"] = time.perf_counter() - started_at
+
+    stage_started_at = time.perf_counter()
+    await client.backup_to_json_file(output_path=output_dir / "backup.json")
+    timings["backup"] = time.perf_counter() - stage_started_at
+
+    stage_started_at = time.perf_counter()
+    await client.set_internal_reply(html_content=HTML_CONTENT)
+    timings["set"] = time.perf_counter() - stage_started_at
+
+    timings["total"] = time.perf_counter() - started_at
+    return timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Delay per request in seconds."
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Probability that a request fails.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    timings: Dict[str, List[float]] = {
+        "connect": [],
+        "backup": [],
+        "set": [],
+        "total": [],
+    }
+    n_failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with FakeEwsServer(
+            latency=args.latency, failure_rate=args.failure_rate, seed=args.seed
+        ) as server:
+            for _ in range(args.iterations):
+                try:
+                    run_timings = await run_once(
+                        service_endpoint=server.service_endpoint,
+                        output_dir=Path(tmp_dir),
+                    )
+                except Exception as e:
+                    n_failures += 1
+                    print(f"Run failed: {e!r}")
+                    continue
+                for stage, value in run_timings.items():
+                    timings[stage].append(value)
+
+            print(f"EWS requests served: {len(server.requests)}")
+
+    print_summary(timings)
+    print(f"Failed runs: {n_failures}/{args.iterations}")
+
+
+if __name__ == "__main__":
+    anyio.run(main)
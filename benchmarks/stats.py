@@ -0,0 +1,23 @@
+import statistics
+from typing import Dict, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the q-th percentile of the given values using nearest rank."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def print_summary(timings: Dict[str, List[float]]) -> None:
+    """Print a summary of the timings in milliseconds."""
+    print(f"{'stage':<10} {'n':>4} {'p50':>9} {'p95':>9} {'max':>9}")
+    for stage, values in timings.items():
+        if len(values) == 0:
+            continue
+        print(
+            f"{stage:<10} {len(values):>4} "
+            f"{statistics.median(values) * 1000:>7.1f}ms "
+            f"{percentile(values, 95) * 1000:>7.1f}ms "
+            f"{max(values) * 1000:>7.1f}ms"
+        )
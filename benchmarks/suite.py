@@ -0,0 +1,425 @@
+"""Runs each stage of the auto-reply flow and the full CLI flow against local stand-ins.
+
+The models, the image CDN and Exchange are replaced by FakeModel, LocalImageServer
+and FakeEwsServer, so the suite runs offline. The repository benchmarks run once
+per repository size. The results are printed as JSON, which benchmarks.compare
+can compare between versions:
+
+    python -m benchmarks.suite --sizes 10 1000 100000 > results.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+import anyio
+from roll.data import AutoReplyRecord, DataRepository, RecordIndex
+from roll.email import AutoReplyHtmlCreator, OutlookAutoReplyClient
+from roll.image import ImageOptimizer
+from roll.io import FileDownloader
+from roll.models import AutoReplyContentGenerator
+from roll.utils import utcnow
+
+from benchmarks.fake_ews import FakeEwsServer
+from benchmarks.fake_llm import FakeModel
+from benchmarks.image_server import LocalImageServer
+from benchmarks.stats import percentile
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+CONFIG_DIR = ROOT_DIR / "config"
+CLI_PATH = ROOT_DIR / "tools" / "cli.py"
+AI_CONFIG_FILE_NAME = "auto-reply-content-gen.aiconfig.json"
+HTML_TEMPLATE_FILE_NAME = "auto-reply-template.html"
+
+
+@dataclass
+class BenchmarkResult:
+    """Represents the measurements of a benchmark."""
+
+    name: str
+    size: Optional[int]
+    iterations: int
+    throughput: float
+    """The number of items processed per second, e.g. records for `repository.get_all`."""
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    peak_memory_bytes: int
+    """The peak memory allocated by Python while running the benchmark once."""
+
+
+async def measure(
+    name: str,
+    run: Callable[[], Awaitable[None]],
+    iterations: int,
+    size: Optional[int] = None,
+    items: int = 1,
+) -> BenchmarkResult:
+    """Times a benchmark and measures its peak memory in a separate run.
+
+    Args:
+        name (str): The name of the benchmark.
+        run (Callable[[], Awaitable[None]]): The function to benchmark.
+        iterations (int): The number of timed runs.
+        size (Optional[int], optional): The repository size, if relevant. Defaults to None.
+        items (int, optional): The number of items processed per run. Defaults to 1.
+
+    Returns:
+        BenchmarkResult: The measurements.
+    """
+    print(f"Running {name} (size={size}, iterations={iterations})...", file=sys.stderr)
+    # The first run loads modules and warms up caches and connections.
+    await run()
+
+    timings: List[float] = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        await run()
+        timings.append(time.perf_counter() - started_at)
+
+    # Tracing allocations slows everything down, so memory is measured separately.
+    tracemalloc.start()
+    try:
+        await run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(
+        name=name,
+        size=size,
+        iterations=iterations,
+        throughput=items * len(timings) / sum(timings),
+        mean_ms=statistics.mean(timings) * 1000,
+        p50_ms=percentile(timings, 50) * 1000,
+        p95_ms=percentile(timings, 95) * 1000,
+        peak_memory_bytes=peak_memory,
+    )
+
+
+async def run_stages(
+    work_dir: Path, image_url: str, ews_endpoint: str, iterations: int
+) -> List[BenchmarkResult]:
+    """Runs each stage of the flow in isolation."""
+    config_file_path = work_dir / AI_CONFIG_FILE_NAME
+    shutil.copyfile(src=CONFIG_DIR / AI_CONFIG_FILE_NAME, dst=config_file_path)
+    template_file_path = CONFIG_DIR / HTML_TEMPLATE_FILE_NAME
+    output_dir = work_dir / "stages"
+    output_dir.mkdir()
+
+    def create_generator() -> AutoReplyContentGenerator:
+        return AutoReplyContentGenerator(
+            config_file_path=config_file_path, output_dir=output_dir, verbose=False
+        )
+
+    async def generate_message() -> None:
+        await create_generator().generate_message()
+
+    async def stream_message() -> None:
+        async with create_generator().stream_message() as tokens:
+            async for _ in tokens:
+                pass
+
+    async def generate_image() -> None:
+        await create_generator().generate_image(auto_reply_message="Hej!")
+
+    async def download_image() -> None:
+        downloader = FileDownloader(
+            output_dir=output_dir, verify_ssl=False, verbose=False
+        )
+        try:
+            await downloader.download_one(url=image_url)
+        finally:
+            await downloader.close()
+
+    await download_image()
+    image_path = output_dir / Path(image_url).name
+    optimizer = ImageOptimizer(max_width=512, quantize=False, image_quality=80)
+
+    async def optimize_image() -> None:
+        optimizer.run(input_path=image_path)
+
+    optimized_image_path = optimizer.run(input_path=image_path)
+    email_creator = AutoReplyHtmlCreator(template_file_path=template_file_path)
+
+    async def render_html() -> None:
+        await email_creator.run(
+            message="Hej!",
+            image_file_path=optimized_image_path,
+            output_path=output_dir / "auto-reply.html",
+        )
+
+    async def publish_oof() -> None:
+        client = OutlookAutoReplyClient(
+            login_name="benchmark",
+            password="benchmark",
+            account_name="benchmark@example.com",
+            service_endpoint=ews_endpoint,
+        )
+        await client.backup_to_json_file(output_path=output_dir / "backup.json")
+        await client.set_internal_reply(html_content="<p>Hej!</p>")
+
+    stages = [
+        ("generate_message", generate_message),
+        ("stream_message", stream_message),
+        ("generate_image", generate_image),
+        ("download_image", download_image),
+        ("optimize_image", optimize_image),
+        ("render_html", render_html),
+        ("publish_oof", publish_oof),
+    ]
+    return [
+        await measure(name=f"stage.{name}", run=run, iterations=iterations)
+        for name, run in stages
+    ]
+
+
+async def run_cli(
+    work_dir: Path, ews_endpoint: str, iterations: int
+) -> List[BenchmarkResult]:
+    """Runs the full flow of tools/cli.py, starting from an empty data directory."""
+    os.environ.setdefault("LOGIN", "benchmark")
+    os.environ.setdefault("PASSWORD", "benchmark")
+    os.environ.setdefault("ACCOUNT_NAME", "benchmark@example.com")
+    from roll.config import settings
+
+    settings.OUTLOOK_SERVICE_ENDPOINT = ews_endpoint
+    settings.INFERENCE_CACHE_DIR = None
+    cli_main = runpy.run_path(str(CLI_PATH))["main"]
+
+    cli_dir = work_dir / "cli"
+    shutil.copytree(src=CONFIG_DIR, dst=cli_dir / "config")
+
+    async def run() -> None:
+        shutil.rmtree(cli_dir / "data", ignore_errors=True)
+        await cli_main()
+
+    with contextlib.chdir(cli_dir):
+        return [await measure(name="cli", run=run, iterations=iterations)]
+
+
+def seed_repository(data_dir: Path, size: int) -> List[str]:
+    """Writes records with generated content directly to a repository directory."""
+    keys = []
+    for i in range(size):
+        key = f"{i:032x}"
+        record_dir = data_dir / key
+        record_dir.mkdir(parents=True)
+        record = AutoReplyRecord(
+            key=key,
+            dir=record_dir,
+            ai_config_path=record_dir / AI_CONFIG_FILE_NAME,
+            html_template_path=record_dir / HTML_TEMPLATE_FILE_NAME,
+            created_at=utcnow(),
+            text="Hej og tak for din e-mail! " * 10,
+            text_created_at=utcnow(),
+            image_url="https://example.com/images/generated.png",
+            image_created_at=utcnow(),
+            original_image_path=record_dir / "generated.png",
+            optimized_image_path=record_dir / "generated-optimized.jpg",
+        )
+        (record_dir / "record.json").write_text(record.to_json())
+        keys.append(key)
+    return keys
+
+
+async def run_repository(
+    work_dir: Path, size: int, iterations: int
+) -> List[BenchmarkResult]:
+    """Runs the repository operations against a repository of the given size."""
+    data_dir = work_dir / f"repository-{size}"
+    print(f"Seeding a repository with {size} records...", file=sys.stderr)
+    keys = seed_repository(data_dir=data_dir, size=size)
+    db = DataRepository(data_dir=data_dir)
+    rng = random.Random(size)
+    record = await db.get(key=keys[0])
+    assert record is not None
+
+    async def get_all() -> None:
+        await db.get_all()
+
+    index = RecordIndex(db=DataRepository(data_dir=data_dir))
+    await index.refresh()
+
+    async def get_index_page() -> None:
+        await index.refresh()
+        await index.get_page(offset=rng.randrange(0, size, 20), limit=20)
+
+    async def get() -> None:
+        await db.get(key=rng.choice(keys))
+
+    async def save() -> None:
+        # Unchanged records are not written, so change the record every time
+        record.pooled = not record.pooled
+        await db.save(record=record)
+
+    async def create() -> None:
+        await db.create(
+            ai_config_path=CONFIG_DIR / AI_CONFIG_FILE_NAME,
+            html_template_path=CONFIG_DIR / HTML_TEMPLATE_FILE_NAME,
+        )
+
+    results = [
+        await measure(
+            name="repository.get_all",
+            run=get_all,
+            iterations=iterations,
+            size=size,
+            items=size,
+        ),
+        await measure(
+            name="repository.index_page",
+            run=get_index_page,
+            iterations=100,
+            size=size,
+            items=20,
+        ),
+        await measure(name="repository.get", run=get, iterations=100, size=size),
+        await measure(name="repository.save", run=save, iterations=100, size=size),
+        await measure(name="repository.create", run=create, iterations=100, size=size),
+    ]
+    shutil.rmtree(data_dir)
+    return results
+
+
+def get_git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_peak_rss() -> int:
+    """Returns the peak resident memory of the process in bytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def print_table(results: List[BenchmarkResult]) -> None:
+    print(
+        f"{'benchmark':<28} {'size':>7} {'n':>4} {'items/s':>10} "
+        f"{'p50':>10} {'p95':>10} {'peak mem':>10}",
+        file=sys.stderr,
+    )
+    for r in results:
+        size = "" if r.size is None else r.size
+        print(
+            f"{r.name:<28} {size:>7} {r.iterations:>4} {r.throughput:>10.1f} "
+            f"{r.p50_ms:>8.2f}ms {r.p95_ms:>8.2f}ms "
+            f"{r.peak_memory_bytes / 1024 / 1024:>8.2f}MB",
+            file=sys.stderr,
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--iterations", type=int, default=20, help="Timed runs per stage."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000, 10000, 100000],
+        help="Repository sizes to run the repository benchmarks with.",
+    )
+    parser.add_argument(
+        "--record-budget",
+        type=int,
+        default=100000,
+        help="Caps the timed runs of repository.get_all to this many records read in total.",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        default=["stage", "cli", "repository"],
+        help="The benchmark groups to run.",
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="Delay per prompt in seconds."
+    )
+    parser.add_argument(
+        "--image-latency",
+        type=float,
+        default=0.0,
+        help="Delay per image download in seconds.",
+    )
+    parser.add_argument(
+        "--ews-latency",
+        type=float,
+        default=0.0,
+        help="Delay per Exchange request in seconds.",
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    results: List[BenchmarkResult] = []
+    # Everything printed by roll goes to stderr to keep stdout machine-readable.
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        with (
+            LocalImageServer(latency=args.image_latency) as images,
+            FakeEwsServer(latency=args.ews_latency) as ews,
+            FakeModel(image_url=images.image_url, latency=args.llm_latency),
+        ):
+            if "stage" in args.only:
+                results += await run_stages(
+                    work_dir=work_dir,
+                    image_url=images.image_url,
+                    ews_endpoint=ews.service_endpoint,
+                    iterations=args.iterations,
+                )
+            if "cli" in args.only:
+                results += await run_cli(
+                    work_dir=work_dir,
+                    ews_endpoint=ews.service_endpoint,
+                    iterations=args.iterations,
+                )
+        if "repository" in args.only:
+            for size in args.sizes:
+                iterations = max(3, min(args.iterations, args.record_budget // size))
+                results += await run_repository(
+                    work_dir=work_dir, size=size, iterations=iterations
+                )
+
+    print_table(results)
+    report = {
+        "created_at": utcnow().isoformat(),
+        "git_revision": get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "peak_rss_bytes": get_peak_rss(),
+        "results": [asdict(r) for r in results],
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output)
+
+
+if __name__ == "__main__":
+    anyio.run(main)
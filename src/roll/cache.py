@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import aiofiles
+
+from roll.data import format_datetime, parse_datetime
+from roll.tracing import get_tracer
+from roll.utils import utcnow
+
+
+class InferenceCache:
+    """Represents a file-based cache of model outputs.
+
+    Each entry is stored as a JSON file named after its key. Entries expire after
+    a fixed time to live, and the oldest entries are evicted once the cache holds
+    more than the maximum number of entries.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        ttl: timedelta = timedelta(minutes=30),
+        max_entries: int = 1000,
+    ) -> None:
+        """Initializes a new instance of the InferenceCache class.
+
+        Args:
+            cache_dir (Path): The directory to store cached outputs in.
+            ttl (timedelta, optional): How long an output stays valid. Keep it shorter than
+                the validity of generated image URLs. Defaults to 30 minutes.
+            max_entries (int, optional): The maximum number of cached outputs. Defaults to 1000.
+        """
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(prompt_name: str, request: Dict[str, Any]) -> str:
+        """Computes the cache key of a prompt run.
+
+        Args:
+            prompt_name (str): The name of the prompt.
+            request (Dict[str, Any]): The resolved request sent to the model, i.e. the
+                prompt with its parameters filled in and the model settings.
+
+        Returns:
+            str: The cache key.
+        """
+        payload = json.dumps(
+            {"prompt_name": prompt_name, "request": request},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Finds a cached output by its key.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[str]: The cached output if found and not expired, None otherwise.
+        """
+        file_path = self._get_file_path(key=key)
+        if not file_path.exists():
+            get_tracer().increment("cache.misses")
+            return None
+        async with aiofiles.open(file_path, mode="r") as f:
+            entry = json.loads(await f.read())
+        created_at = parse_datetime(entry["created_at"])
+        if created_at is None or utcnow() - created_at > self._ttl:
+            file_path.unlink(missing_ok=True)
+            get_tracer().increment("cache.misses")
+            return None
+        get_tracer().increment("cache.hits")
+        return str(entry["text"])
+
+    async def put(self, key: str, prompt_name: str, text: str) -> None:
+        """Stores an output in the cache.
+
+        Args:
+            key (str): The cache key.
+            prompt_name (str): The name of the prompt that generated the output.
+            text (str): The output to cache.
+        """
+        entry = {
+            "created_at": format_datetime(utcnow()),
+            "prompt_name": prompt_name,
+            "text": text,
+        }
+        file_path = self._get_file_path(key=key)
+        # Every write gets a temporary file of its own, so that concurrent writes of
+        # the same key do not rename each other's files
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self._cache_dir, prefix=f".{file_path.name}.", suffix=".tmp"
+        )
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, mode="w") as f:
+                await f.write(json.dumps(entry, indent=2))
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        """Removes expired entries and the oldest entries above the size limit."""
+        now = utcnow().timestamp()
+        entries = []
+        for file_path in self._cache_dir.glob("*.json"):
+            try:
+                mtime = file_path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if now - mtime > self._ttl.total_seconds():
+                file_path.unlink(missing_ok=True)
+            else:
+                entries.append((mtime, file_path))
+
+        entries.sort()
+        for _, file_path in entries[: max(0, len(entries) - self._max_entries)]:
+            file_path.unlink(missing_ok=True)
+
+    def _get_file_path(self, key: str) -> Path:
+        return self._cache_dir / f"{key}.json"
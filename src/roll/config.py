@@ -1,3 +1,6 @@
+from pathlib import Path
+from typing import Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -8,6 +11,17 @@ class Settings(BaseSettings):
     ACCOUNT_NAME: str = Field(env="ACCOUNT_NAME")
     LOGIN: str = Field(env="LOGIN")
     PASSWORD: str = Field(env="PASSWORD")
+    OUTLOOK_SERVICE_ENDPOINT: Optional[str] = Field(
+        default=None, env="OUTLOOK_SERVICE_ENDPOINT"
+    )
+
+    INFERENCE_CACHE_DIR: Optional[Path] = Field(default=None, env="INFERENCE_CACHE_DIR")
+    INFERENCE_CACHE_TTL_SECONDS: int = Field(
+        default=1800, env="INFERENCE_CACHE_TTL_SECONDS"
+    )
+    INFERENCE_CACHE_MAX_ENTRIES: int = Field(
+        default=1000, env="INFERENCE_CACHE_MAX_ENTRIES"
+    )
 
     class Config:
         env_file = ".env"
@@ -1,16 +1,21 @@
+import bisect
 import json
+import os
 import shutil
+import threading
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import aiofiles
 from pydantic import BaseModel, Field
 
+from roll.tracing import get_tracer, traced
 from roll.utils import utcnow
 
 RECORD_FILE_NAME = "record.json"
+ACTIVE_OOF_FILE_NAME = "active-oof.json"
 
 
 def format_datetime(dt: Optional[datetime]) -> Optional[str]:
@@ -55,6 +60,13 @@ class AutoReplyRecord:
         image_url: Optional[str] = None,
         original_image_path: Optional[Path] = None,
         optimized_image_path: Optional[Path] = None,
+        html_path: Optional[Path] = None,
+        pooled: bool = False,
+        published_at: Optional[datetime] = None,
+        completed_stages: Optional[List[str]] = None,
+        job_id: Optional[str] = None,
+        job_status: Optional[str] = None,
+        job_error: Optional[str] = None,
     ) -> None:
         # Immutable attributes
         self._key = key
@@ -72,6 +84,16 @@ class AutoReplyRecord:
         self.image_url: Optional[str] = image_url
         self.original_image_path: Optional[Path] = original_image_path
         self.optimized_image_path: Optional[Path] = optimized_image_path
+        self.html_path: Optional[Path] = html_path
+        self.pooled: bool = pooled
+        self.published_at: Optional[datetime] = published_at
+        self.completed_stages: List[str] = (
+            [] if completed_stages is None else completed_stages
+        )
+        self.job_id: Optional[str] = job_id
+        self.job_status: Optional[str] = job_status
+        self.job_error: Optional[str] = job_error
+        self._saved_state: Optional[str] = None
 
     @property
     def key(self) -> str:
@@ -93,6 +115,15 @@ class AutoReplyRecord:
     def html_template_path(self) -> Path:
         return self._html_template_path
 
+    @property
+    def is_dirty(self) -> bool:
+        """Return whether the record changed since it was loaded or saved."""
+        return self.to_json() != self._saved_state
+
+    def mark_clean(self) -> None:
+        """Mark the current state of the record as saved."""
+        self._saved_state = self.to_json()
+
     def to_json(self, indent: int = 2) -> str:
         """Dump the model as JSON."""
         return json.dumps(
@@ -114,6 +145,13 @@ class AutoReplyRecord:
             "image_url": self.image_url,
             "original_image_path": format_path(self.original_image_path),
             "optimized_image_path": format_path(self.optimized_image_path),
+            "html_path": format_path(self.html_path),
+            "pooled": self.pooled,
+            "published_at": format_datetime(self.published_at),
+            "completed_stages": self.completed_stages,
+            "job_id": self.job_id,
+            "job_status": self.job_status,
+            "job_error": self.job_error,
         }
 
     @classmethod
@@ -124,7 +162,7 @@ class AutoReplyRecord:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "AutoReplyRecord":
         """Load the model from a dict."""
-        return cls(
+        record = cls(
             key=data["key"],
             created_at=parse_datetime(data["created_at"]),
             dir=Path(data["dir"]),
@@ -136,7 +174,20 @@ class AutoReplyRecord:
             image_url=data["image_url"],
             original_image_path=parse_path(data["original_image_path"]),
             optimized_image_path=parse_path(data["optimized_image_path"]),
+            html_path=parse_path(data.get("html_path")),
+            pooled=data.get("pooled", False),
+            published_at=parse_datetime(data.get("published_at")),
+            completed_stages=data.get("completed_stages"),
+            job_id=data.get("job_id"),
+            job_status=data.get("job_status"),
+            job_error=data.get("job_error"),
         )
+        record.mark_clean()
+        return record
+
+
+RecordListener = Callable[["AutoReplyRecord"], None]
+"""Called with a record after it is saved."""
 
 
 class DataRepository:
@@ -151,7 +202,22 @@ class DataRepository:
         self._data_dir = data_dir
         if not self._data_dir.exists():
             self._data_dir.mkdir(parents=True, exist_ok=True)
+        self._listeners: List[RecordListener] = []
 
+    @property
+    def data_dir(self) -> Path:
+        return self._data_dir
+
+    def subscribe(self, listener: RecordListener) -> None:
+        """Registers a function to call whenever a record is created or saved.
+
+        Args:
+            listener (RecordListener): The function to call. It is called on the
+                thread that saved the record and must not block.
+        """
+        self._listeners.append(listener)
+
+    @traced("data.get_keys")
     async def get_keys(self) -> List[str]:
         """Returns the keys of existing records."""
         file_names = [
@@ -161,6 +227,7 @@ class DataRepository:
         ]
         return file_names
 
+    @traced("data.get_all")
     async def get_all(self) -> List[AutoReplyRecord]:
         """Returns existing records.
 
@@ -172,6 +239,7 @@ class DataRepository:
         sorted_records = sorted(records, key=lambda r: r.created_at, reverse=True)
         return list(sorted_records)
 
+    @traced("data.create")
     async def create(
         self, ai_config_path: Path, html_template_path: Path
     ) -> AutoReplyRecord:
@@ -205,16 +273,37 @@ class DataRepository:
         await self.save(record=record)
         return record
 
+    @traced("data.save")
     async def save(self, record: AutoReplyRecord) -> None:
-        """Save the given record to disk.
+        """Save the given record to disk, unless it is unchanged.
 
         Args:
             record (AutoReplyRecord): The record to save.
         """
+        if not record.is_dirty:
+            get_tracer().increment("data.saves_skipped")
+            return
+
         file_path = record.dir / RECORD_FILE_NAME
-        async with aiofiles.open(file_path, mode="w") as f:
+        # Write atomically, since background jobs save records while they are read
+        tmp_path = file_path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        async with aiofiles.open(tmp_path, mode="w") as f:
             await f.write(record.to_json(indent=2))
+        os.replace(tmp_path, file_path)
+        record.mark_clean()
+        for listener in self._listeners:
+            listener(record)
+
+    @traced("data.delete")
+    async def delete(self, key: str) -> None:
+        """Deletes a record and its files, if it exists.
 
+        Args:
+            key (str): The key of the record to delete.
+        """
+        shutil.rmtree(self._data_dir / key, ignore_errors=True)
+
+    @traced("data.get")
     async def get(self, key: str) -> Optional[AutoReplyRecord]:
         """Finds a record by its key.
 
@@ -232,6 +321,135 @@ class DataRepository:
         return AutoReplyRecord.from_json(json_data=json_data)
 
 
+class RecordSummary(BaseModel):
+    """Represents what a listing of records shows about a record."""
+
+    key: str = Field(...)
+    created_at: datetime = Field(...)
+    n_words: Optional[int] = Field(default=None)
+    """The number of words in the message, or None if there is no message yet."""
+
+    optimized_image_path: Optional[Path] = Field(default=None)
+    modified_at: int = Field(...)
+    """The modification time in nanoseconds of the record file that was read."""
+
+    @classmethod
+    def from_record(cls, record: AutoReplyRecord, modified_at: int) -> "RecordSummary":
+        """Summarize a record."""
+        return cls(
+            key=record.key,
+            created_at=record.created_at,
+            n_words=None if record.text is None else len(record.text.split()),
+            optimized_image_path=record.optimized_image_path,
+            modified_at=modified_at,
+        )
+
+
+class RecordIndex:
+    """Represents an in-memory listing of the records of a repository, newest first.
+
+    The index reads every record once, on the first refresh, and is then kept up to
+    date incrementally. Records saved through the repository are applied when they
+    are saved. Records created by other processes are read when the data directory
+    changes, and the records on a requested page are read again if their file
+    changed. Records whose directory is gone are dropped. Methods can be called
+    from any thread.
+    """
+
+    def __init__(self, db: DataRepository) -> None:
+        """Initializes a new instance of the RecordIndex class.
+
+        Args:
+            db (DataRepository): The repository to list the records of.
+        """
+        self._db = db
+        self._lock = threading.Lock()
+        self._summaries: Dict[str, RecordSummary] = {}
+        self._order: List[Tuple[datetime, str]] = []
+        """The creation time and key of the summarized records, oldest first."""
+
+        self._pending: Set[str] = set()
+        """The keys of record directories that had no record file yet."""
+
+        self._dir_modified_at: Optional[int] = None
+        self._db.subscribe(self._on_saved)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._summaries)
+
+    async def refresh(self) -> None:
+        """Reads the records that were created since the last refresh."""
+        modified_at = self._db.data_dir.stat().st_mtime_ns
+        if modified_at != self._dir_modified_at:
+            self._dir_modified_at = modified_at
+            keys = set(await self._db.get_keys())
+            with self._lock:
+                self._pending.update(k for k in keys if k not in self._summaries)
+                self._pending.intersection_update(keys)
+                removed = [k for k in self._summaries if k not in keys]
+            for key in removed:
+                self._remove(key=key)
+        with self._lock:
+            pending = list(self._pending)
+        for key in pending:
+            await self._read(key=key)
+
+    async def get_page(self, offset: int, limit: int) -> List[RecordSummary]:
+        """Returns a window of the summaries, newest first.
+
+        Args:
+            offset (int): The number of newer records to skip.
+            limit (int): The maximum number of summaries to return.
+
+        Returns:
+            List[RecordSummary]: The summaries, up to date with the record files.
+        """
+        with self._lock:
+            end = max(0, len(self._order) - offset)
+            start = max(0, end - limit)
+            keys = [key for _, key in reversed(self._order[start:end])]
+        for key in keys:
+            summary = self._summaries.get(key)
+            if summary is None or self._get_modified_at(key=key) != summary.modified_at:
+                await self._read(key=key)
+        with self._lock:
+            return [self._summaries[key] for key in keys if key in self._summaries]
+
+    def _get_modified_at(self, key: str) -> Optional[int]:
+        try:
+            return (self._db.data_dir / key / RECORD_FILE_NAME).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    async def _read(self, key: str) -> None:
+        modified_at = self._get_modified_at(key=key)
+        record = None if modified_at is None else await self._db.get(key=key)
+        if record is not None:
+            self._apply(record=record, modified_at=modified_at or 0)
+        elif not (self._db.data_dir / key).exists():
+            self._remove(key=key)
+
+    def _on_saved(self, record: AutoReplyRecord) -> None:
+        modified_at = self._get_modified_at(key=record.key)
+        self._apply(record=record, modified_at=modified_at or 0)
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            summary = self._summaries.pop(key, None)
+            self._pending.discard(key)
+            if summary is not None:
+                self._order.remove((summary.created_at, key))
+
+    def _apply(self, record: AutoReplyRecord, modified_at: int) -> None:
+        summary = RecordSummary.from_record(record=record, modified_at=modified_at)
+        with self._lock:
+            if record.key not in self._summaries:
+                bisect.insort(self._order, (record.created_at, record.key))
+            self._summaries[record.key] = summary
+            self._pending.discard(record.key)
+
+
 class ActiveOutOfOfficeSetting(BaseModel):
     """Represents the active out-of-office setting."""
 
@@ -256,6 +474,49 @@ class ActiveOutOfOfficeSetting(BaseModel):
     outlook_old_settings_path: Path = Field(...)
     """The location of the backup of the old Outlook OOF settings."""
 
+    settings_hash: Optional[str] = Field(default=None)
+    """The hash of the OOF settings sent to Outlook."""
+
+    start_at: Optional[datetime] = Field(default=None)
+    """The date and time when the OOF window starts."""
+
+    end_at: Optional[datetime] = Field(default=None)
+    """The date and time when the OOF window ends."""
+
+    def is_active(self, settings_hash: str, at: Optional[datetime] = None) -> bool:
+        """Checks whether the given settings are already active.
+
+        Args:
+            settings_hash (str): The hash of the settings to compare with.
+            at (Optional[datetime], optional): The time to check. Defaults to now.
+
+        Returns:
+            bool: True if the settings match and the window covers the given time.
+        """
+        if self.settings_hash is None or self.settings_hash != settings_hash:
+            return False
+        if self.start_at is None or self.end_at is None:
+            return False
+        at = utcnow() if at is None else at
+        return self.start_at <= at < self.end_at
+
+    @classmethod
+    async def load(cls, output_dir: Path) -> Optional["ActiveOutOfOfficeSetting"]:
+        """Load the active out-of-office setting from disk.
+
+        Args:
+            output_dir (Path): The output directory.
+
+        Returns:
+            Optional[ActiveOutOfOfficeSetting]: The active setting if found, None otherwise.
+        """
+        file_path = output_dir / ACTIVE_OOF_FILE_NAME
+        if not file_path.exists():
+            return None
+        async with aiofiles.open(file_path, mode="r") as f:
+            json_data = await f.read()
+        return cls.model_validate_json(json_data)
+
     async def save(self, output_dir: Path) -> None:
         """Save the active out-of-office setting to disk.
 
@@ -263,12 +524,12 @@ class ActiveOutOfOfficeSetting(BaseModel):
             output_dir (Path): The output directory.
         """
         output_dir.mkdir(parents=True, exist_ok=True)
-        output_path = output_dir / "active-oof.json"
+        output_path = output_dir / ACTIVE_OOF_FILE_NAME
 
         # Backup current active out-of-office settings.
         if output_path.exists():
             utcnow_str = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
-            backup_path = output_dir / f"{utcnow_str}-active-oof.json"
+            backup_path = output_dir / f"{utcnow_str}-{ACTIVE_OOF_FILE_NAME}"
             shutil.copyfile(src=output_path, dst=backup_path)
 
         async with aiofiles.open(output_path, mode="w") as f:
@@ -1,41 +1,107 @@
+import hashlib
 import json
 from base64 import b64encode
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import cast
+from typing import Any, Dict, Optional, Tuple, cast
 
 import aiofiles
-from exchangelib import Account, Credentials, OofSettings
+import anyio
+from exchangelib import DELEGATE, Account, Configuration, Credentials, OofSettings
 from exchangelib.ewsdatetime import EWSDateTime
 
+from roll.tracing import get_tracer, traced
+
+# https://learn.microsoft.com/en-us/exchange/client-developer/web-service-reference/externalaudience
+# The external_audience determines to whom external Out of Office messages are sent:
+# - Known: External Out of Office messages are sent only to recipients who are in the user's Contacts folder.
+# - All: External Out of Office messages are sent to all recipients.
+# - None: No external Out of Office messages are sent.
+OOF_EXTERNAL_AUDIENCE = "None"
+OOF_EXTERNAL_REPLY = "-"  # Cannot be empty string or None!
+
+
+def compute_oof_settings_hash(
+    html_content: str,
+    state: str = OofSettings.ENABLED,
+    external_audience: str = OOF_EXTERNAL_AUDIENCE,
+    external_reply: str = OOF_EXTERNAL_REPLY,
+) -> str:
+    """Computes a hash of out-of-office settings.
+
+    The defaults are the settings written by `set_internal_reply`. The reply window
+    is not part of the hash because it is relative to the time the settings are
+    written. Compare the window separately.
+
+    Args:
+        html_content (str): The internal auto-reply message.
+        state (str, optional): The state of the settings. Defaults to enabled.
+        external_audience (str, optional): Who gets the external auto-reply.
+            Defaults to OOF_EXTERNAL_AUDIENCE.
+        external_reply (str, optional): The external auto-reply message.
+            Defaults to OOF_EXTERNAL_REPLY.
+
+    Returns:
+        str: The SHA-256 hex digest of the settings.
+    """
+    settings = {
+        "state": state,
+        "external_audience": external_audience,
+        "internal_reply": html_content,
+        "external_reply": external_reply,
+    }
+    payload = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
 
 class OutlookAutoReplyClient:
     """Represents a client for interacting with Outlook's out-of-office settings."""
 
-    def __init__(self, login_name: str, password: str, account_name: str) -> None:
+    def __init__(
+        self,
+        login_name: str,
+        password: str,
+        account_name: str,
+        service_endpoint: Optional[str] = None,
+    ) -> None:
         """Initializes a new instance of the OutlookAutoReplyClient class.
 
         Args:
             login_name (str): The login name of the Outlook account.
             password (str): The password of the Outlook account.
             account_name (str): The name of the Outlook account.
+            service_endpoint (Optional[str], optional): The URL of the EWS endpoint
+                to use instead of autodiscovering it. Defaults to None.
 
         """
         credentials = Credentials(username=login_name, password=password)
-        self._account = Account(
-            account_name, credentials=credentials, autodiscover=True
-        )
+        with get_tracer().span("ews.connect", autodiscover=service_endpoint is None):
+            if service_endpoint is None:
+                self._account = Account(
+                    account_name, credentials=credentials, autodiscover=True
+                )
+            else:
+                config = Configuration(
+                    service_endpoint=service_endpoint, credentials=credentials
+                )
+                self._account = Account(
+                    account_name,
+                    config=config,
+                    autodiscover=False,
+                    access_type=DELEGATE,
+                )
+
+    async def get_settings(self) -> Dict[str, Any]:
+        """Gets Outlook's current out-of-office settings.
 
-    async def backup_to_json_file(self, output_path: Path) -> None:
-        """Backup Outlook's current out-of-office settings to disk.
-
-        Args:
-            output_path (Path): The location where to store the backup.
+        Returns:
+            Dict[str, Any]: The settings, in the format of the backup files.
         """
-        oof = cast(OofSettings, self._account.oof_settings)
+        # exchangelib is blocking, so talk to Exchange from a worker thread.
+        oof = await anyio.to_thread.run_sync(self._get_oof_settings)
         start_at = cast(EWSDateTime, oof.start)
         end_at = cast(EWSDateTime, oof.end)
-        settings = {
+        return {
             "state": oof.state,
             "start": start_at.ewsformat(),
             "end": end_at.ewsformat(),
@@ -43,34 +109,55 @@ class OutlookAutoReplyClient:
             "internal_reply": oof.internal_reply,
             "external_reply": oof.external_reply,
         }
+
+    async def backup_to_json_file(
+        self, output_path: Path, settings: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Backup Outlook's current out-of-office settings to disk.
+
+        Args:
+            output_path (Path): The location where to store the backup.
+            settings (Optional[Dict[str, Any]], optional): The settings to back up, as
+                returned by `get_settings`. Defaults to None, which gets them first.
+        """
+        if settings is None:
+            settings = await self.get_settings()
         # Save settings to disk as JSON
         async with aiofiles.open(output_path, "w") as file:
             json_content = json.dumps(settings, indent=2)
             await file.write(json_content)
 
-    async def set_internal_reply(self, html_content: str) -> None:
+    async def set_internal_reply(self, html_content: str) -> Tuple[datetime, datetime]:
         """Sets the internal auto-reply message for a month.
 
         Args:
             html_content (str): The message to set as the internal auto-reply.
+
+        Returns:
+            Tuple[datetime, datetime]: The start and end of the auto-reply window.
         """
         start_at = datetime.now(tz=timezone.utc) - timedelta(days=1)
         end_at = datetime.now(tz=timezone.utc) + timedelta(days=5)
 
         print(f"Setting internal auto-reply message from {start_at} to {end_at}...")
-        self._account.oof_settings = OofSettings(
+        oof = OofSettings(
             state=OofSettings.ENABLED,
-            # https://learn.microsoft.com/en-us/exchange/client-developer/web-service-reference/externalaudience
-            # The external_audience determines to whom external Out of Office messages are sent:
-            # - Known: External Out of Office messages are sent only to recipients who are in the user's Contacts folder.
-            # - All: External Out of Office messages are sent to all recipients.
-            # - None: No external Out of Office messages are sent.
-            external_audience="None",
+            external_audience=OOF_EXTERNAL_AUDIENCE,
             internal_reply=html_content,
-            external_reply="-",  # Cannot be empty string or None!
+            external_reply=OOF_EXTERNAL_REPLY,
             start=start_at,
             end=end_at,
         )
+        await anyio.to_thread.run_sync(self._set_oof_settings, oof)
+        return start_at, end_at
+
+    @traced("ews.get_oof_settings")
+    def _get_oof_settings(self) -> OofSettings:
+        return cast(OofSettings, self._account.oof_settings)
+
+    @traced("ews.set_oof_settings")
+    def _set_oof_settings(self, oof: OofSettings) -> None:
+        self._account.oof_settings = oof
 
 
 class AutoReplyHtmlCreator:
@@ -87,6 +174,7 @@ class AutoReplyHtmlCreator:
         if not template_file_path.exists():
             raise ValueError(f"File {template_file_path} not found")
 
+    @traced("email.render_html")
     async def run(self, message: str, image_file_path: Path, output_path: Path) -> str:
         """Creates the HTML for an auto-reply message.
 
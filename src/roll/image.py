@@ -2,6 +2,8 @@ from pathlib import Path
 
 from PIL import Image
 
+from roll.tracing import traced
+
 
 class ImageOptimizer:
     def __init__(self, max_width: int, quantize: bool, image_quality: int) -> None:
@@ -16,6 +18,7 @@ class ImageOptimizer:
         self._quantize = quantize
         self._image_quality = image_quality
 
+    @traced("image.optimize")
     def run(self, input_path: Path) -> Path:
         """Optimizes an image and stores the image on disk.
 
@@ -6,6 +6,8 @@ import aiofiles
 import aiohttp
 from tqdm.asyncio import tqdm_asyncio
 
+from roll.tracing import get_tracer, traced
+
 
 class FileDownloader:
     """Represents a class that downloads files."""
@@ -33,6 +35,7 @@ class FileDownloader:
         self._output_dir.mkdir(parents=True, exist_ok=True)
         self._verbose = verbose
 
+    @traced("io.download_one")
     async def download_one(
         self, url: str, local_file_name: Optional[str] = None
     ) -> Path:
@@ -61,6 +64,7 @@ class FileDownloader:
                     async for data in response.content.iter_chunked(self._chunk_size):
                         await file.write(data)
                         progress_bar.update(len(data))
+                        get_tracer().increment("io.downloaded_bytes", len(data))
         return file_path
 
     async def close(self) -> None:
@@ -0,0 +1,336 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiofiles
+import anyio
+from pydantic import BaseModel, Field
+
+from roll.data import AutoReplyRecord, DataRepository
+from roll.tracing import Tracer, get_tracer, use_tracer
+from roll.utils import utcnow
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class Job(BaseModel):
+    """Represents an operation on a record that runs in the background."""
+
+    job_id: str = Field(...)
+    record_key: str = Field(...)
+    kind: str = Field(...)
+    """The operation to run, e.g. `generate-image`."""
+
+    params: Dict[str, Any] = Field(default_factory=dict)
+    status: str = Field(default=JOB_QUEUED)
+    created_at: datetime = Field(...)
+    started_at: Optional[datetime] = Field(default=None)
+    finished_at: Optional[datetime] = Field(default=None)
+    progress: Optional[str] = Field(default=None)
+    """What the job has produced so far, e.g. the message being generated."""
+
+    result: Optional[str] = Field(default=None)
+    """A message about the outcome of a successful job."""
+
+    error: Optional[str] = Field(default=None)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (JOB_QUEUED, JOB_RUNNING)
+
+    @property
+    def dedupe_key(self) -> str:
+        """Jobs with the same key do the same work."""
+        return json.dumps([self.record_key, self.kind, self.params], sort_keys=True)
+
+
+class JobQueue:
+    """Represents a file-based queue of jobs.
+
+    Each job is stored as a JSON file and mirrored in memory, so it is cheap to
+    poll. Jobs that were running when the process stopped are queued again when
+    the queue is loaded. Methods can be called from any thread.
+    """
+
+    def __init__(self, jobs_dir: Path, max_finished_jobs: int = 1000) -> None:
+        """Initializes a new instance of the JobQueue class.
+
+        Args:
+            jobs_dir (Path): The directory to store jobs in.
+            max_finished_jobs (int, optional): The maximum number of finished jobs to
+                keep. The oldest are removed first. Defaults to 1000.
+        """
+        self._jobs_dir = jobs_dir
+        self._jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._max_finished_jobs = max_finished_jobs
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        for file_path in self._jobs_dir.glob("*.json"):
+            job = Job.model_validate_json(file_path.read_text())
+            if job.status == JOB_RUNNING:
+                job.status = JOB_QUEUED
+                job.started_at = None
+            self._jobs[job.job_id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Finds a job by its identifier."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_for_record(self, record_key: str) -> List[Job]:
+        """Returns the jobs of a record, oldest first."""
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.record_key == record_key]
+        return sorted(jobs, key=lambda j: j.created_at)
+
+    def get_active(self, record_key: str) -> Optional[Job]:
+        """Returns the oldest queued or running job of a record, if any."""
+        active = [j for j in self.get_for_record(record_key) if j.is_active]
+        return active[0] if len(active) > 0 else None
+
+    async def submit(
+        self, record_key: str, kind: str, params: Optional[Dict[str, Any]] = None
+    ) -> Job:
+        """Queues a job, unless the same job is already queued or running.
+
+        Args:
+            record_key (str): The key of the record to run the job on.
+            kind (str): The operation to run.
+            params (Optional[Dict[str, Any]], optional): The parameters of the operation.
+                Defaults to None.
+
+        Returns:
+            Job: The new job, or the identical job that is already in flight.
+        """
+        job = Job(
+            job_id=uuid.uuid4().hex,
+            record_key=record_key,
+            kind=kind,
+            params=params or {},
+            created_at=utcnow(),
+        )
+        with self._lock:
+            for existing in self._jobs.values():
+                if existing.is_active and existing.dedupe_key == job.dedupe_key:
+                    return existing
+            self._jobs[job.job_id] = job
+        await self._write(job)
+        return job
+
+    async def claim(self) -> Optional[Job]:
+        """Marks the oldest queued job as running and returns it.
+
+        Jobs of a record that already has a running job are skipped, so that jobs
+        on the same record never run concurrently.
+        """
+        with self._lock:
+            busy = {
+                j.record_key for j in self._jobs.values() if j.status == JOB_RUNNING
+            }
+            queued = [
+                j
+                for j in self._jobs.values()
+                if j.status == JOB_QUEUED and j.record_key not in busy
+            ]
+            if len(queued) == 0:
+                return None
+            job = min(queued, key=lambda j: j.created_at)
+            job.status = JOB_RUNNING
+            job.started_at = utcnow()
+        await self._write(job)
+        return job
+
+    def set_progress(self, job_id: str, progress: str) -> None:
+        """Updates the progress of a running job. Progress is not persisted."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.progress = progress
+
+    async def finish(
+        self, job_id: str, result: Optional[str] = None, error: Optional[str] = None
+    ) -> Job:
+        """Marks a running job as succeeded, or as failed if an error is given.
+
+        Args:
+            job_id (str): The identifier of the job.
+            result (Optional[str], optional): A message about the outcome. Defaults to None.
+            error (Optional[str], optional): The error the job failed with. Defaults to None.
+
+        Returns:
+            Job: The finished job.
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            job.status = JOB_SUCCEEDED if error is None else JOB_FAILED
+            job.finished_at = utcnow()
+            job.result = result
+            job.error = error
+        await self._write(job)
+        self._evict()
+        return job
+
+    async def _write(self, job: Job) -> None:
+        """Writes a job atomically to its file."""
+        file_path = self._jobs_dir / f"{job.job_id}.json"
+        tmp_path = file_path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        async with aiofiles.open(tmp_path, mode="w") as f:
+            await f.write(job.model_dump_json(indent=2, exclude={"progress"}))
+        os.replace(tmp_path, file_path)
+
+    def _evict(self) -> None:
+        """Removes the oldest finished jobs above the limit."""
+        with self._lock:
+            finished = sorted(
+                (j for j in self._jobs.values() if not j.is_active),
+                key=lambda j: j.created_at,
+            )
+            evicted = finished[: max(0, len(finished) - self._max_finished_jobs)]
+            for job in evicted:
+                del self._jobs[job.job_id]
+        for job in evicted:
+            (self._jobs_dir / f"{job.job_id}.json").unlink(missing_ok=True)
+
+
+JobHandler = Callable[[Job, AutoReplyRecord], Awaitable[Optional[str]]]
+"""Runs a job on its record and returns a message about the outcome, if any."""
+
+
+class JobWorkerPool:
+    """Represents workers that run queued jobs in a background thread.
+
+    The workers run on their own event loop, so jobs keep running while the
+    thread that submitted them, e.g. a Streamlit script run, moves on or is
+    stopped. The status of the latest job is recorded on its record. Jobs
+    submitted through the pool are traced with the tracer in use when they were
+    submitted.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        db: DataRepository,
+        handler: JobHandler,
+        n_workers: int = 2,
+        poll_interval: float = 0.2,
+    ) -> None:
+        """Initializes a new instance of the JobWorkerPool class.
+
+        Args:
+            queue (JobQueue): The queue to take jobs from.
+            db (DataRepository): The repository of the records the jobs run on.
+            handler (JobHandler): The function that runs a job.
+            n_workers (int, optional): The number of jobs to run concurrently. Defaults to 2.
+            poll_interval (float, optional): How long an idle worker waits before checking
+                the queue again, in seconds. Defaults to 0.2.
+        """
+        self._queue = queue
+        self._db = db
+        self._handler = handler
+        self._n_workers = n_workers
+        self._poll_interval = poll_interval
+        self._tracers: Dict[str, Tracer] = {}
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def queue(self) -> JobQueue:
+        return self._queue
+
+    async def submit(
+        self, record_key: str, kind: str, params: Optional[Dict[str, Any]] = None
+    ) -> Job:
+        """Queues a job, unless the same job is already queued or running.
+
+        Args:
+            record_key (str): The key of the record to run the job on.
+            kind (str): The operation to run.
+            params (Optional[Dict[str, Any]], optional): The parameters of the operation.
+                Defaults to None.
+
+        Returns:
+            Job: The new job, or the identical job that is already in flight.
+        """
+        job = await self._queue.submit(record_key=record_key, kind=kind, params=params)
+        self._tracers.setdefault(job.job_id, get_tracer())
+        return job
+
+    def start(self) -> None:
+        """Starts the workers in a background thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=anyio.run, args=(self._run,), name="roll-job-workers", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the workers after their current jobs."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _run(self) -> None:
+        async with anyio.create_task_group() as tg:
+            for _ in range(self._n_workers):
+                tg.start_soon(self._work)
+
+    async def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await self._queue.claim()
+            except Exception as e:
+                print(f"Failed to claim a job: {e!r}")
+                job = None
+            if job is None:
+                await anyio.sleep(self._poll_interval)
+                continue
+            try:
+                with use_tracer(self._tracers.pop(job.job_id, get_tracer())):
+                    await self._run_job(job=job)
+            except Exception as e:
+                # The job is finished already, only its record could not be updated
+                print(f"Failed to record the outcome of job {job.job_id}: {e!r}")
+
+    async def _run_job(self, job: Job) -> None:
+        """Runs a job and finishes it, also when loading or saving its record fails."""
+        record = None
+        result = None
+        error = None
+        try:
+            record = await self._db.get(key=job.record_key)
+            if record is None:
+                raise ValueError(f"Record {job.record_key} not found")
+            record.job_id = job.job_id
+            record.job_status = JOB_RUNNING
+            record.job_error = None
+            await self._db.save(record=record)
+            result = await self._handler(job, record)
+        except Exception as e:
+            print(f"Job {job.job_id} ({job.kind}) failed: {e!r}")
+            error = str(e) or repr(e)
+        job = await self._finish(job=job, result=result, error=error)
+
+        if record is not None:
+            record.job_status = job.status
+            record.job_error = job.error
+            await self._db.save(record=record)
+
+    async def _finish(
+        self, job: Job, result: Optional[str], error: Optional[str]
+    ) -> Job:
+        """Finishes a job. It is finished in memory even if its file cannot be written."""
+        try:
+            return await self._queue.finish(
+                job_id=job.job_id, result=result, error=error
+            )
+        except Exception as e:
+            print(f"Failed to save the outcome of job {job.job_id}: {e!r}")
+            return self._queue.get(job_id=job.job_id) or job
@@ -1,26 +1,167 @@
+import functools
+import hashlib
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import anyio
 from aiconfig import AIConfigRuntime, InferenceOptions
+from aiconfig.default_parsers.dalle import DalleImageGenerationParser
+from aiconfig.default_parsers.openai import OpenAIInference
+from aiconfig.registry import ModelParserRegistry
+from aiconfig.schema import ExecuteResult
+
+from roll.cache import InferenceCache
+from roll.tracing import get_tracer, traced
+
+
+def copy_runtime(runtime: AIConfigRuntime) -> AIConfigRuntime:
+    """Returns a deep copy of the given runtime that does not share any outputs."""
+    runtime_copy = runtime.model_copy(deep=True)
+    runtime_copy.file_path = runtime.file_path
+    return runtime_copy
+
+
+class AIConfigRuntimePool:
+    """Represents a cache of loaded AI Config runtimes.
+
+    Runtimes are keyed by the path and the content hash of the AI Config file, so a
+    changed file is always reloaded. The cached runtimes are never run. Instead,
+    each caller gets its own copy so that concurrent jobs do not overwrite each
+    other's outputs.
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        """Initializes a new instance of the AIConfigRuntimePool class.
+
+        Args:
+            max_size (int, optional): The maximum number of runtimes to keep. Defaults to 32.
+        """
+        self._max_size = max_size
+        self._runtimes: "OrderedDict[Tuple[str, str], AIConfigRuntime]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, config_file_path: Path) -> AIConfigRuntime:
+        """Returns a runtime for the given AI Config file.
+
+        Args:
+            config_file_path (Path): The path to the AI Config file.
+
+        Returns:
+            AIConfigRuntime: A runtime that is not shared with other callers.
+        """
+        key = self._get_key(config_file_path=config_file_path)
+        with self._lock:
+            runtime = self._runtimes.get(key)
+            if runtime is not None:
+                self._runtimes.move_to_end(key)
+                self.hits += 1
+                get_tracer().increment("runtime_pool.hits")
+                return copy_runtime(runtime)
+            self.misses += 1
+        get_tracer().increment("runtime_pool.misses")
+
+        runtime = AIConfigRuntime.load(str(config_file_path))
+        self._put(key=key, runtime=runtime)
+        return copy_runtime(runtime)
+
+    def update(self, config_file_path: Path, runtime: AIConfigRuntime) -> None:
+        """Caches a runtime that has just been saved to the given AI Config file.
+
+        Args:
+            config_file_path (Path): The path the runtime was saved to.
+            runtime (AIConfigRuntime): The runtime that was saved.
+        """
+        key = self._get_key(config_file_path=config_file_path)
+        self._put(key=key, runtime=copy_runtime(runtime))
+
+    def clear(self) -> None:
+        """Removes all cached runtimes."""
+        with self._lock:
+            self._runtimes.clear()
+
+    def _put(self, key: Tuple[str, str], runtime: AIConfigRuntime) -> None:
+        with self._lock:
+            self._runtimes[key] = runtime
+            self._runtimes.move_to_end(key)
+            while len(self._runtimes) > self._max_size:
+                self._runtimes.popitem(last=False)
+
+    def _get_key(self, config_file_path: Path) -> Tuple[str, str]:
+        content_hash = hashlib.sha256(config_file_path.read_bytes()).hexdigest()
+        return str(config_file_path.resolve()), content_hash
+
+
+runtime_pool = AIConfigRuntimePool()
+
+
+class AutoReplyCandidate:
+    """Represents a generated auto-reply message and the image generated for it."""
+
+    def __init__(self, message: str, image_url: str, runtime: AIConfigRuntime) -> None:
+        """Initializes a new instance of the AutoReplyCandidate class.
+
+        Args:
+            message (str): The generated message.
+            image_url (str): The URL of the generated image.
+            runtime (AIConfigRuntime): The runtime holding the outputs of the candidate.
+        """
+        self._message = message
+        self._image_url = image_url
+        self._runtime = runtime
+
+    @property
+    def message(self) -> str:
+        return self._message
+
+    @property
+    def image_url(self) -> str:
+        return self._image_url
+
+    @property
+    def runtime(self) -> AIConfigRuntime:
+        return self._runtime
 
 
 class AutoReplyContentGenerator:
     """Represents a class that generates content for auto-reply messages."""
 
-    def __init__(self, config_file_path: Path, output_dir: Path, verbose: bool) -> None:
+    def __init__(
+        self,
+        config_file_path: Path,
+        output_dir: Path,
+        verbose: bool,
+        pool: Optional[AIConfigRuntimePool] = None,
+        cache: Optional[InferenceCache] = None,
+    ) -> None:
         """Initializes a new instance of the AutoReplyContentGenerator class.
 
         Args:
             config_file_path (Path): The path to the AI Config file to use.
             output_dir (Path): The directory to save outputs to.
             verbose (bool): Whether to print debug messages to stdout.
+            pool (Optional[AIConfigRuntimePool], optional): The pool to get the runtime
+                from. Defaults to the shared `runtime_pool`.
+            cache (Optional[InferenceCache], optional): The cache to reuse model outputs
+                from. Outputs are not cached if None. Defaults to None.
         """
         if not config_file_path.exists():
             raise ValueError(f"File {config_file_path} not found")
 
         self._output_path: Path = output_dir / config_file_path.name
-        self._runtime: AIConfigRuntime = AIConfigRuntime.load(config_file_path)
+        self._pool = runtime_pool if pool is None else pool
+        self._runtime: AIConfigRuntime = self._pool.acquire(config_file_path)
         self._verbose = verbose
+        self._cache = cache
 
+    @traced("models.generate_message")
     async def generate_message(self) -> str:
         """Generates an auto-reply message.
 
@@ -32,15 +173,113 @@ class AutoReplyContentGenerator:
         if self._verbose:
             print("Running inference for prompt 'generate-text'...")
 
-        auto_reply_message = await self._runtime.run_and_get_output_text(
-            prompt_name="generate-text",
-            options=inference_options,
-        )
-        self._save_outputs()
+        try:
+            auto_reply_message = await self._run_prompt(
+                prompt_name="generate-text",
+                options=inference_options,
+            )
+        finally:
+            await self._save_outputs()
 
         print(f"Generated auto-reply message:\n{auto_reply_message}\n")
         return auto_reply_message
 
+    @asynccontextmanager
+    async def stream_message(self) -> AsyncIterator[AsyncIterator[str]]:
+        """Generates an auto-reply message and streams it as it is being generated.
+
+        The model client blocks while it reads the response stream, so inference
+        runs in a worker thread that is owned by the context manager. The tokens
+        are read inside the context, and leaving it early stops the inference:
+
+            async with generator.stream_message() as tokens:
+                async for token in tokens:
+                    print(token, end="")
+
+        Yields:
+            AsyncIterator[str]: The chunks of the generated message.
+        """
+        cache_key = await self._get_cache_key(prompt_name="generate-text")
+        cached_message = await self._get_cached_output(
+            prompt_name="generate-text", cache_key=cache_key
+        )
+        if cached_message is not None:
+
+            async def iterate_cached() -> AsyncIterator[str]:
+                yield cached_message
+
+            yield iterate_cached()
+            return
+
+        send_stream, receive_stream = anyio.create_memory_object_stream[str](
+            max_buffer_size=math.inf
+        )
+        results: List[str] = []
+        errors: List[Exception] = []
+
+        def on_stream_delta(data: Any, accumulated_data: Any, index: int) -> None:
+            content = data.get("content") if isinstance(data, dict) else None
+            if index == 0 and content:
+                # Fails once the tokens are no longer read, which stops the inference
+                anyio.from_thread.run_sync(send_stream.send_nowait, content)
+
+        inference_options = InferenceOptions(
+            stream=True, stream_callback=on_stream_delta
+        )
+
+        async def run_inference() -> None:
+            async with send_stream:
+                try:
+                    message = await self._run_prompt_in_thread(
+                        runtime=self._runtime,
+                        prompt_name="generate-text",
+                        options=inference_options,
+                    )
+                    results.append(message)
+                except Exception as e:
+                    errors.append(e)
+
+        async def iterate_tokens(attributes: Dict[str, Any]) -> AsyncIterator[str]:
+            n_streamed = 0
+            async for token in receive_stream:
+                n_streamed += 1
+                yield token
+            attributes["n_tokens"] = n_streamed
+
+            if len(errors) > 0:
+                raise errors[0]
+            # Not all model parsers call the stream callback
+            if n_streamed == 0:
+                yield results[0]
+            if cache_key is not None and self._cache is not None:
+                await self._cache.put(
+                    key=cache_key, prompt_name="generate-text", text=results[0]
+                )
+
+        if self._verbose:
+            print("Running inference for prompt 'generate-text' with streaming...")
+
+        # Errors raised while reading the tokens are raised as they are instead of
+        # in an exception group of the task group
+        error: Optional[Exception] = None
+        try:
+            with get_tracer().span("models.stream_message") as attributes:
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(run_inference)
+                    async with receive_stream:
+                        tokens = iterate_tokens(attributes=attributes)
+                        try:
+                            yield tokens
+                        except Exception as e:
+                            error = e
+                        finally:
+                            await tokens.aclose()
+        finally:
+            await self._save_outputs()
+        if error is not None:
+            raise error
+
+    @traced("models.generate_image")
     async def generate_image(self, auto_reply_message: str) -> str:
         """Generates an image to accompany the given auto-reply message.
 
@@ -50,40 +289,243 @@ class AutoReplyContentGenerator:
         Returns:
             str: The URL of the generated image.
         """
+        try:
+            image_url = await self._generate_image(
+                auto_reply_message=auto_reply_message
+            )
+        finally:
+            await self._save_outputs()
+
+        if self._verbose:
+            print(f"Generated image URL:\n{image_url}\n")
+
+        return image_url
+
+    async def generate_candidates(
+        self, n_candidates: int, max_concurrency: int = 3
+    ) -> List[AutoReplyCandidate]:
+        """Generates several auto-reply messages and an image for each concurrently.
+
+        The image of a candidate is generated as soon as its message is ready,
+        without waiting for the other candidates. The inference cache is not used,
+        since it would return the same message for every candidate.
+
+        Args:
+            n_candidates (int): The number of candidates to generate.
+            max_concurrency (int, optional): The maximum number of model calls to run
+                at the same time. Defaults to 3.
+
+        Returns:
+            List[AutoReplyCandidate]: The candidates that were generated successfully.
+        """
+        limiter = anyio.CapacityLimiter(max_concurrency)
+        candidates: List[Optional[AutoReplyCandidate]] = [None] * n_candidates
+        errors: List[Exception] = []
+
+        async def generate_candidate(index: int) -> None:
+            try:
+                candidates[index] = await self._generate_candidate(limiter=limiter)
+            except Exception as e:
+                print(f"Failed to generate candidate {index + 1}: {e!r}")
+                errors.append(e)
+
+        async with anyio.create_task_group() as tg:
+            for index in range(n_candidates):
+                tg.start_soon(generate_candidate, index)
+
+        generated = [c for c in candidates if c is not None]
+        if len(generated) == 0 and len(errors) > 0:
+            raise errors[0]
+        return generated
+
+    async def select_candidate(self, candidate: AutoReplyCandidate) -> None:
+        """Makes the outputs of the given candidate the outputs of this generator.
+
+        Args:
+            candidate (AutoReplyCandidate): The candidate the user picked.
+        """
+        self._runtime = copy_runtime(candidate.runtime)
+        await self._save_outputs()
+
+    async def _generate_candidate(
+        self, limiter: anyio.CapacityLimiter
+    ) -> AutoReplyCandidate:
+        """Generates a message and its image with a runtime of its own."""
+        runtime = copy_runtime(self._runtime)
+        inference_options = InferenceOptions(stream=False)
+        message = await self._run_prompt_in_thread(
+            runtime=runtime,
+            prompt_name="generate-text",
+            options=inference_options,
+            limiter=limiter,
+        )
+        if self._verbose:
+            print(f"Generated candidate message:\n{message}\n")
+        dall_e_prompt = await self._run_prompt_in_thread(
+            runtime=runtime,
+            prompt_name="generate-dall-e-prompt",
+            options=inference_options,
+            params={"auto_reply_message": message},
+            limiter=limiter,
+        )
+        image_url = await self._run_prompt_in_thread(
+            runtime=runtime,
+            prompt_name="generate-image",
+            options=inference_options,
+            params={"dall_e_prompt": dall_e_prompt},
+            limiter=limiter,
+        )
+        return AutoReplyCandidate(message=message, image_url=image_url, runtime=runtime)
+
+    async def _run_prompt_in_thread(
+        self,
+        runtime: AIConfigRuntime,
+        prompt_name: str,
+        options: InferenceOptions,
+        params: Optional[Dict[str, Any]] = None,
+        limiter: Optional[anyio.CapacityLimiter] = None,
+    ) -> str:
+        """Runs a prompt in a worker thread.
+
+        The model clients used by aiconfig block while waiting for a response, so
+        running prompts without blocking the event loop requires a thread per prompt.
+        """
+        run_prompt = functools.partial(
+            runtime.run_and_get_output_text,
+            prompt_name=prompt_name,
+            options=options,
+            params=params,
+        )
+        with get_tracer().span("models.inference", prompt_name=prompt_name):
+            return await anyio.to_thread.run_sync(
+                anyio.run, run_prompt, limiter=limiter
+            )
+
+    async def _generate_image(self, auto_reply_message: str) -> str:
+        """Runs the prompts that generate an image without saving outputs."""
         if self._verbose:
             print("Running inference for prompt 'generate-dall-e-prompt'...")
 
         inference_options = InferenceOptions(stream=False)
-        dall_e_prompt = await self._runtime.run_and_get_output_text(
+        dall_e_prompt = await self._run_prompt(
             prompt_name="generate-dall-e-prompt",
             options=inference_options,
             params={
                 "auto_reply_message": auto_reply_message,
             },
         )
-        self._save_outputs()
 
         if self._verbose:
             print(f"Generated prompt for DALL-E:\n{dall_e_prompt}\n")
             print("Running inference for prompt 'generate-image'...")
 
-        image_url = await self._runtime.run_and_get_output_text(
+        return await self._run_prompt(
             prompt_name="generate-image",
             options=inference_options,
             params={
                 "dall_e_prompt": dall_e_prompt,
             },
         )
-        self._save_outputs()
 
+    async def _run_prompt(
+        self,
+        prompt_name: str,
+        options: InferenceOptions,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Runs a prompt and returns its output, reusing a cached output if possible."""
+        cache_key = await self._get_cache_key(prompt_name=prompt_name, params=params)
+        cached_output = await self._get_cached_output(
+            prompt_name=prompt_name, cache_key=cache_key
+        )
+        if cached_output is not None:
+            return cached_output
+
+        output = await self._run_prompt_in_thread(
+            runtime=self._runtime,
+            prompt_name=prompt_name,
+            options=options,
+            params=params,
+        )
+        if cache_key is not None and self._cache is not None:
+            await self._cache.put(key=cache_key, prompt_name=prompt_name, text=output)
+        return output
+
+    async def _get_cache_key(
+        self, prompt_name: str, params: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Returns the cache key of a prompt run, or None if caching is disabled."""
+        if self._cache is None:
+            return None
+        request = await self._runtime.resolve(prompt_name=prompt_name, params=params)
+        return self._cache.make_key(prompt_name=prompt_name, request=request)
+
+    async def _get_cached_output(
+        self, prompt_name: str, cache_key: Optional[str]
+    ) -> Optional[str]:
+        """Returns the cached output for the given key, if any.
+
+        A cached output is added to the outputs of the prompt like a model run would
+        add it, so that it is saved and later prompts see it, e.g. as chat history.
+        """
+        if cache_key is None or self._cache is None:
+            return None
+        output = await self._cache.get(key=cache_key)
+        if output is None:
+            return None
         if self._verbose:
-            print(f"Generated image URL:\n{image_url}\n")
+            print(f"Using cached output {cache_key}.")
+        self._add_output(prompt_name=prompt_name, text=output)
+        return output
 
-        return image_url
+    def _add_output(self, prompt_name: str, text: str) -> None:
+        """Sets the output of a prompt in the shape its model parser produces."""
+        prompt = self._runtime.get_prompt(prompt_name)
+        parser = ModelParserRegistry.get_model_parser_for_prompt(prompt, self._runtime)
+        if isinstance(parser, OpenAIInference):
+            output = ExecuteResult(
+                output_type="execute_result",
+                data={"role": "assistant", "content": text},
+                execution_count=0,
+                metadata={"finish_reason": "stop"},
+            )
+        else:
+            output = ExecuteResult(
+                output_type="execute_result",
+                data=text,
+                execution_count=0,
+                metadata={},
+                mime_type=(
+                    "image/png"
+                    if isinstance(parser, DalleImageGenerationParser)
+                    else None
+                ),
+            )
+        self._runtime.add_output(prompt_name, output, overwrite=True)
+
+    @traced("models.save_outputs")
+    async def _save_outputs(self) -> None:
+        """Saves the outputs of the models to a JSON file.
+
+        Serializing and writing the file happens in a worker thread so that the
+        event loop is not blocked.
+        """
+        await anyio.to_thread.run_sync(self._write_outputs)
 
-    def _save_outputs(self) -> None:
-        """Saves the outputs of the models to a JSON file."""
-        self._runtime.save(
-            json_config_filepath=str(self._output_path),
-            include_outputs=True,
+    def _write_outputs(self) -> None:
+        """Writes the outputs of the models atomically to a JSON file."""
+        # Write to a temporary file in the same directory and then rename it, so
+        # that readers never see a partially written file.
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self._output_path.parent,
+            prefix=f".{self._output_path.name}.",
+            suffix=".tmp",
         )
+        os.close(fd)
+        try:
+            self._runtime.save(json_config_filepath=tmp_path, include_outputs=True)
+            os.replace(tmp_path, self._output_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._pool.update(config_file_path=self._output_path, runtime=self._runtime)
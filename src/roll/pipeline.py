@@ -0,0 +1,590 @@
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import aiofiles
+import anyio
+
+from roll.cache import InferenceCache
+from roll.data import ActiveOutOfOfficeSetting, AutoReplyRecord, DataRepository
+from roll.email import (
+    AutoReplyHtmlCreator,
+    OutlookAutoReplyClient,
+    compute_oof_settings_hash,
+)
+from roll.image import ImageOptimizer
+from roll.io import FileDownloader
+from roll.models import AutoReplyContentGenerator
+from roll.tracing import get_tracer
+from roll.utils import utcnow
+
+STAGE_GENERATE_MESSAGE = "generate-message"
+STAGE_GENERATE_IMAGE = "generate-image"
+STAGE_DOWNLOAD_IMAGE = "download-image"
+STAGE_OPTIMIZE_IMAGE = "optimize-image"
+STAGE_RENDER_HTML = "render-html"
+STAGE_CONNECT_OUTLOOK = "connect-outlook"
+STAGE_BACKUP_OOF = "backup-oof"
+STAGE_PUBLISH = "publish"
+
+AUTO_REPLY_STAGE_DEPENDENCIES: Dict[str, List[str]] = {
+    STAGE_GENERATE_MESSAGE: [],
+    STAGE_GENERATE_IMAGE: [STAGE_GENERATE_MESSAGE],
+    STAGE_DOWNLOAD_IMAGE: [STAGE_GENERATE_IMAGE],
+    STAGE_OPTIMIZE_IMAGE: [STAGE_DOWNLOAD_IMAGE],
+    STAGE_RENDER_HTML: [STAGE_OPTIMIZE_IMAGE],
+    STAGE_CONNECT_OUTLOOK: [],
+    STAGE_BACKUP_OOF: [STAGE_CONNECT_OUTLOOK],
+    STAGE_PUBLISH: [STAGE_RENDER_HTML, STAGE_BACKUP_OOF],
+}
+"""The stages of the auto-reply pipeline and the stages each of them depends on."""
+
+HTML_FILE_NAME = "auto-reply.html"
+
+
+class Stage:
+    """Represents a step of a pipeline."""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Awaitable[None]],
+        depends_on: Optional[List[str]] = None,
+        checkpoint: bool = True,
+    ) -> None:
+        """Initializes a new instance of the Stage class.
+
+        Args:
+            name (str): The unique name of the stage.
+            run (Callable[[], Awaitable[None]]): The function that runs the stage.
+            depends_on (Optional[List[str]], optional): The names of the stages that must
+                complete before this stage can run. Defaults to None.
+            checkpoint (bool, optional): Whether the completion of the stage is recorded
+                so that it can be skipped when resuming. Stages that only produce
+                in-memory state, such as connections, must not be checkpointed.
+                Defaults to True.
+        """
+        self._name = name
+        self._run = run
+        self._depends_on: List[str] = [] if depends_on is None else list(depends_on)
+        self._checkpoint = checkpoint
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def depends_on(self) -> List[str]:
+        return self._depends_on
+
+    @property
+    def checkpoint(self) -> bool:
+        return self._checkpoint
+
+    async def run(self) -> None:
+        await self._run()
+
+
+class Pipeline:
+    """Represents a set of stages that run concurrently as far as their dependencies allow."""
+
+    def __init__(self, stages: List[Stage]) -> None:
+        """Initializes a new instance of the Pipeline class.
+
+        Args:
+            stages (List[Stage]): The stages of the pipeline.
+
+        Raises:
+            ValueError: If the stages have duplicate names, unknown dependencies or cycles.
+        """
+        self._stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self._stages:
+                raise ValueError(f"Stage {stage.name} is defined more than once")
+            self._stages[stage.name] = stage
+
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self._stages:
+                    raise ValueError(
+                        f"Stage {stage.name} depends on unknown stage {dependency}"
+                    )
+        self._check_for_cycles()
+
+    def get_dependencies(self, names: List[str]) -> Set[str]:
+        """Returns the given stages and all stages they depend on, directly or not."""
+        result: Set[str] = set()
+        pending = list(names)
+        while len(pending) > 0:
+            name = pending.pop()
+            if name not in result:
+                result.add(name)
+                pending.extend(self._stages[name].depends_on)
+        return result
+
+    def get_dependents(self, names: List[str]) -> Set[str]:
+        """Returns the given stages and all stages that depend on them, directly or not."""
+        result: Set[str] = set()
+        pending = list(names)
+        while len(pending) > 0:
+            name = pending.pop()
+            if name not in result:
+                result.add(name)
+                pending.extend(
+                    s.name for s in self._stages.values() if name in s.depends_on
+                )
+        return result
+
+    async def run(
+        self,
+        targets: List[str],
+        completed: Set[str],
+        rerun: Optional[List[str]] = None,
+        on_stage_completed: Optional[Callable[[Stage], Awaitable[None]]] = None,
+    ) -> None:
+        """Runs the given stages and the stages they depend on.
+
+        Checkpointed stages in `completed` are skipped, unless they are in `rerun` or
+        depend on a stage that runs. The `completed` set is updated as stages run: a
+        running stage invalidates all stages that depend on it.
+
+        Args:
+            targets (List[str]): The names of the stages to run.
+            completed (Set[str]): The names of the stages completed by earlier runs.
+            rerun (Optional[List[str]], optional): The names of the stages to run even
+                if they are completed. Defaults to None.
+            on_stage_completed (Optional[Callable[[Stage], Awaitable[None]]], optional):
+                Called after each stage completes, e.g. to persist `completed`.
+                Defaults to None.
+        """
+        needed = self.get_dependencies(targets)
+        rerun_names = set(rerun or [])
+        to_run: Set[str] = set()
+        for name in self._get_order(names=needed):
+            stage = self._stages[name]
+            if (
+                not stage.checkpoint
+                or name not in completed
+                or name in rerun_names
+                or any(d in to_run for d in stage.depends_on)
+            ):
+                to_run.add(name)
+
+        completed.difference_update(self.get_dependents(list(to_run)))
+        done = {name: anyio.Event() for name in needed}
+        errors: List[Exception] = []
+
+        async def run_stage(stage: Stage) -> None:
+            for dependency in stage.depends_on:
+                await done[dependency].wait()
+            if stage.name in to_run:
+                try:
+                    with get_tracer().span(f"pipeline.{stage.name}"):
+                        await stage.run()
+                except Exception as e:
+                    errors.append(e)
+                    tg.cancel_scope.cancel()
+                    return
+                if stage.checkpoint:
+                    completed.add(stage.name)
+                if on_stage_completed is not None:
+                    await on_stage_completed(stage)
+            done[stage.name].set()
+
+        async with anyio.create_task_group() as tg:
+            for name in needed:
+                tg.start_soon(run_stage, self._stages[name])
+
+        if len(errors) > 0:
+            raise errors[0]
+
+    def _get_order(self, names: Set[str]) -> List[str]:
+        """Returns the given stages in an order where dependencies come first."""
+        order: List[str] = []
+        visited: Set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            visited.add(name)
+            for dependency in self._stages[name].depends_on:
+                visit(dependency)
+            if name in names:
+                order.append(name)
+
+        for name in sorted(names):
+            visit(name)
+        return order
+
+    def _check_for_cycles(self) -> None:
+        visiting: Set[str] = set()
+        visited: Set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            for dependency in self._stages[name].depends_on:
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in self._stages:
+            visit(name)
+
+
+class AutoReplyPipeline:
+    """Represents the flow from generating the content of a record to publishing it.
+
+    The completed stages are recorded on the record, so a run that failed or was
+    interrupted resumes from the last completed stage. Connecting to Outlook and
+    backing up its settings do not depend on the content and run while it is
+    being generated.
+    """
+
+    def __init__(
+        self,
+        db: DataRepository,
+        record: AutoReplyRecord,
+        oof_data_dir: Path,
+        outlook_login_name: str,
+        outlook_password: str,
+        outlook_account_name: str,
+        outlook_service_endpoint: Optional[str] = None,
+        inference_cache: Optional[InferenceCache] = None,
+        force_publish: bool = False,
+        on_message_token: Optional[Callable[[str], None]] = None,
+        verbose: bool = True,
+    ) -> None:
+        """Initializes a new instance of the AutoReplyPipeline class.
+
+        Args:
+            db (DataRepository): The repository to save the record to.
+            record (AutoReplyRecord): The record to generate and publish the content of.
+            oof_data_dir (Path): The directory to store out-of-office data in.
+            outlook_login_name (str): The login name of the Outlook account.
+            outlook_password (str): The password of the Outlook account.
+            outlook_account_name (str): The name of the Outlook account.
+            outlook_service_endpoint (Optional[str], optional): The URL of the EWS endpoint
+                to use instead of autodiscovering it. Defaults to None.
+            inference_cache (Optional[InferenceCache], optional): The cache of model outputs.
+                Defaults to None.
+            force_publish (bool, optional): Whether to write the out-of-office settings
+                even if they are already active. Defaults to False.
+            on_message_token (Optional[Callable[[str], None]], optional): Called with each
+                token of the message as it is generated. Defaults to None.
+            verbose (bool, optional): Whether to print progress. Defaults to True.
+        """
+        self._db = db
+        self._record = record
+        self._oof_data_dir = oof_data_dir
+        self._outlook_login_name = outlook_login_name
+        self._outlook_password = outlook_password
+        self._outlook_account_name = outlook_account_name
+        self._outlook_service_endpoint = outlook_service_endpoint
+        self._inference_cache = inference_cache
+        self._force_publish = force_publish
+        self._on_message_token = on_message_token
+        self._verbose = verbose
+
+        self._save_lock = anyio.Lock()
+        self._completed: Set[str] = set(self.get_completed_stages(record=record))
+        self._outlook: Optional[OutlookAutoReplyClient] = None
+        self._outlook_old_settings_path: Optional[Path] = None
+        self._published = False
+
+        runs: Dict[str, Callable[[], Awaitable[None]]] = {
+            STAGE_GENERATE_MESSAGE: self._generate_message,
+            STAGE_GENERATE_IMAGE: self._generate_image,
+            STAGE_DOWNLOAD_IMAGE: self._download_image,
+            STAGE_OPTIMIZE_IMAGE: self._optimize_image,
+            STAGE_RENDER_HTML: self._render_html,
+            STAGE_CONNECT_OUTLOOK: self._connect_outlook,
+            STAGE_BACKUP_OOF: self._backup_oof,
+            STAGE_PUBLISH: self._publish,
+        }
+        not_checkpointed = {STAGE_CONNECT_OUTLOOK, STAGE_BACKUP_OOF, STAGE_PUBLISH}
+        self._pipeline = Pipeline(
+            stages=[
+                Stage(
+                    name=name,
+                    run=runs[name],
+                    depends_on=depends_on,
+                    checkpoint=name not in not_checkpointed,
+                )
+                for name, depends_on in AUTO_REPLY_STAGE_DEPENDENCIES.items()
+            ]
+        )
+
+    @property
+    def published(self) -> bool:
+        """Whether the last run wrote the out-of-office settings to Outlook."""
+        return self._published
+
+    @staticmethod
+    def get_completed_stages(record: AutoReplyRecord) -> List[str]:
+        """Returns the completed stages of a record.
+
+        Records created before stages were recorded have their content but no
+        completed stages, so these are derived from the content instead.
+
+        Args:
+            record (AutoReplyRecord): The record to get the completed stages of.
+
+        Returns:
+            List[str]: The names of the completed stages.
+        """
+        if len(record.completed_stages) > 0:
+            return list(record.completed_stages)
+
+        outputs = [
+            (STAGE_GENERATE_MESSAGE, record.text),
+            (STAGE_GENERATE_IMAGE, record.image_url),
+            (STAGE_DOWNLOAD_IMAGE, record.original_image_path),
+            (STAGE_OPTIMIZE_IMAGE, record.optimized_image_path),
+        ]
+        completed: List[str] = []
+        for name, output in outputs:
+            if output is None:
+                break
+            completed.append(name)
+        return completed
+
+    @staticmethod
+    def invalidate(record: AutoReplyRecord, stages: List[str]) -> None:
+        """Marks the given stages, and the stages that depend on them, as not completed.
+
+        Use it when the content of a record is changed outside of the pipeline, e.g.
+        when the message is edited by hand.
+
+        Args:
+            record (AutoReplyRecord): The record to update.
+            stages (List[str]): The names of the stages whose output changed.
+        """
+        invalidated = set(stages)
+        changed = True
+        while changed:
+            changed = False
+            for name, depends_on in AUTO_REPLY_STAGE_DEPENDENCIES.items():
+                if name not in invalidated and invalidated.intersection(depends_on):
+                    invalidated.add(name)
+                    changed = True
+        record.completed_stages = [
+            s for s in record.completed_stages if s not in invalidated
+        ]
+
+    async def run(self, targets: List[str], rerun: Optional[List[str]] = None) -> None:
+        """Runs the given stages and the stages they depend on.
+
+        Args:
+            targets (List[str]): The names of the stages to run.
+            rerun (Optional[List[str]], optional): The names of the stages to run even
+                if they are completed. Defaults to None.
+        """
+        self._published = False
+        targets = list(targets)
+        if STAGE_PUBLISH in targets and await self._is_already_published(rerun=rerun):
+            if self._verbose:
+                print("Out-of-office message is already active. Skipping publish.")
+            targets.remove(STAGE_PUBLISH)
+            if len(targets) == 0:
+                return
+
+        await self._pipeline.run(
+            targets=targets,
+            completed=self._completed,
+            rerun=rerun,
+            on_stage_completed=self._on_stage_completed,
+        )
+
+    async def _is_already_published(self, rerun: Optional[List[str]]) -> bool:
+        """Checks whether the rendered HTML of the record is already active in Outlook.
+
+        Only the HTML of an earlier run is checked, so that connecting to Outlook can
+        still overlap with generating new content.
+        """
+        if self._force_publish or self._record.html_path is None:
+            return False
+        needed = self._pipeline.get_dependencies([STAGE_RENDER_HTML])
+        if not needed.issubset(self._completed):
+            return False
+        if len(self._pipeline.get_dependents(rerun or []).intersection(needed)) > 0:
+            return False
+        if not self._record.html_path.exists():
+            return False
+
+        active_oof = await ActiveOutOfOfficeSetting.load(output_dir=self._oof_data_dir)
+        if active_oof is None:
+            return False
+        async with aiofiles.open(self._record.html_path, "r") as file:
+            email_text = await file.read()
+        return active_oof.is_active(
+            settings_hash=compute_oof_settings_hash(html_content=email_text)
+        )
+
+    async def _on_stage_completed(self, stage: Stage) -> None:
+        if not stage.checkpoint:
+            return
+        self._record.completed_stages = [
+            name for name in AUTO_REPLY_STAGE_DEPENDENCIES if name in self._completed
+        ]
+        await self._save()
+
+    async def _save(self) -> None:
+        async with self._save_lock:
+            await self._db.save(record=self._record)
+
+    def _create_generator(self) -> AutoReplyContentGenerator:
+        return AutoReplyContentGenerator(
+            config_file_path=self._record.ai_config_path,
+            output_dir=self._record.dir,
+            verbose=self._verbose,
+            cache=self._inference_cache,
+        )
+
+    async def _generate_message(self) -> None:
+        generator = self._create_generator()
+        if self._on_message_token is None:
+            message = await generator.generate_message()
+        else:
+            message = ""
+            async with generator.stream_message() as tokens:
+                async for token in tokens:
+                    message += token
+                    self._on_message_token(token)
+        self._record.text = message
+        self._record.text_created_at = utcnow()
+
+    async def _generate_image(self) -> None:
+        assert self._record.text is not None
+        generator = self._create_generator()
+        self._record.image_url = await generator.generate_image(
+            auto_reply_message=self._record.text
+        )
+        self._record.image_created_at = utcnow()
+
+    async def _download_image(self) -> None:
+        assert self._record.image_url is not None
+        downloader = FileDownloader(
+            output_dir=self._record.dir, verify_ssl=False, verbose=self._verbose
+        )
+        try:
+            self._record.original_image_path = await downloader.download_one(
+                url=self._record.image_url
+            )
+        finally:
+            await downloader.close()
+
+    async def _optimize_image(self) -> None:
+        assert self._record.original_image_path is not None
+        optimizer = ImageOptimizer(max_width=512, quantize=False, image_quality=80)
+        self._record.optimized_image_path = await anyio.to_thread.run_sync(
+            optimizer.run, self._record.original_image_path
+        )
+
+    async def _render_html(self) -> None:
+        assert self._record.text is not None
+        assert self._record.optimized_image_path is not None
+        email_creator = AutoReplyHtmlCreator(
+            template_file_path=self._record.html_template_path
+        )
+        self._record.html_path = self._record.dir / HTML_FILE_NAME
+        await email_creator.run(
+            message=self._record.text,
+            image_file_path=self._record.optimized_image_path,
+            output_path=self._record.html_path,
+        )
+
+    async def _connect_outlook(self) -> None:
+        self._outlook = await anyio.to_thread.run_sync(
+            partial(
+                OutlookAutoReplyClient,
+                login_name=self._outlook_login_name,
+                password=self._outlook_password,
+                account_name=self._outlook_account_name,
+                service_endpoint=self._outlook_service_endpoint,
+            )
+        )
+
+    async def _backup_oof(self) -> None:
+        # Always read the live settings, since they may have been changed in Outlook
+        # by hand since the last publish.
+        assert self._outlook is not None
+        settings = await self._outlook.get_settings()
+        live_hash = compute_oof_settings_hash(
+            html_content=settings["internal_reply"] or "",
+            state=settings["state"],
+            external_audience=settings["external_audience"],
+            external_reply=settings["external_reply"],
+        )
+
+        # If the live settings are the ones we published last, the user's own
+        # settings were backed up before that publish.
+        active_oof = await ActiveOutOfOfficeSetting.load(output_dir=self._oof_data_dir)
+        if active_oof is not None and active_oof.settings_hash == live_hash:
+            self._outlook_old_settings_path = active_oof.outlook_old_settings_path
+            return
+
+        utcnow_str = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
+        self._outlook_old_settings_path = (
+            self._oof_data_dir / "backups" / f"{utcnow_str}-outlook-oof.json"
+        )
+        self._outlook_old_settings_path.parent.mkdir(parents=True, exist_ok=True)
+        if self._verbose:
+            print(
+                (
+                    f"Backing up Outlook's current out-of-office settings to "
+                    f"{self._outlook_old_settings_path}..."
+                )
+            )
+        await self._outlook.backup_to_json_file(
+            output_path=self._outlook_old_settings_path, settings=settings
+        )
+
+    async def _publish(self) -> None:
+        assert self._outlook is not None
+        assert self._outlook_old_settings_path is not None
+        assert self._record.html_path is not None
+        assert self._record.text is not None
+        assert self._record.original_image_path is not None
+        assert self._record.optimized_image_path is not None
+
+        async with aiofiles.open(self._record.html_path, "r") as file:
+            email_text = await file.read()
+
+        # Newly generated content can still render to the active settings
+        settings_hash = compute_oof_settings_hash(html_content=email_text)
+        active_oof = await ActiveOutOfOfficeSetting.load(output_dir=self._oof_data_dir)
+        if not self._force_publish and active_oof is not None:
+            if active_oof.is_active(settings_hash=settings_hash):
+                if self._verbose:
+                    print("Out-of-office message is already active. Skipping publish.")
+                return
+
+        if self._verbose:
+            print(
+                f"Publishing record {self._record.key} as the out-of-office message..."
+            )
+        start_at, end_at = await self._outlook.set_internal_reply(
+            html_content=email_text
+        )
+        self._published = True
+
+        self._record.published_at = utcnow()
+        await self._save()
+
+        active_oof = ActiveOutOfOfficeSetting(
+            created_at=utcnow(),
+            record_key=self._record.key,
+            generated_message=self._record.text,
+            original_generated_image_path=self._record.original_image_path,
+            optimized_generated_image_path=self._record.optimized_image_path,
+            email_text=email_text,
+            outlook_old_settings_path=self._outlook_old_settings_path,
+            settings_hash=settings_hash,
+            start_at=start_at,
+            end_at=end_at,
+        )
+        await active_oof.save(output_dir=self._oof_data_dir)
@@ -0,0 +1,240 @@
+import tempfile
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+import anyio
+
+from roll.data import AutoReplyRecord, DataRepository
+from roll.models import AutoReplyContentGenerator
+from roll.pipeline import STAGE_PUBLISH, STAGE_RENDER_HTML, AutoReplyPipeline
+from roll.tracing import get_tracer
+from roll.utils import utcnow
+
+
+class AutoReplyScheduler:
+    """Represents a scheduler that rotates the out-of-office message every day.
+
+    The scheduler keeps a pool of records in the repository that are generated,
+    optimized and rendered ahead of time. Rotating the message then only has to
+    send the pre-rendered HTML to Outlook.
+
+    Failures are logged and retried with an increasing delay, so a temporary
+    outage of Exchange, the models or the image CDN does not stop the scheduler.
+    Pool records that cannot be prepared are removed from the repository.
+    """
+
+    def __init__(
+        self,
+        db: DataRepository,
+        ai_config_path: Path,
+        html_template_path: Path,
+        oof_data_dir: Path,
+        outlook_login_name: str,
+        outlook_password: str,
+        outlook_account_name: str,
+        pool_size: int,
+        rotate_at: time,
+        outlook_service_endpoint: Optional[str] = None,
+        min_retry_delay: float = 60.0,
+        max_retry_delay: float = 3600.0,
+    ) -> None:
+        """Initializes a new instance of the AutoReplyScheduler class.
+
+        Args:
+            db (DataRepository): The repository to keep the pool in.
+            ai_config_path (Path): The path to the AI Config file to generate content with.
+            html_template_path (Path): The path to the HTML template to render content with.
+            oof_data_dir (Path): The directory to store out-of-office data in.
+            outlook_login_name (str): The login name of the Outlook account.
+            outlook_password (str): The password of the Outlook account.
+            outlook_account_name (str): The name of the Outlook account.
+            pool_size (int): The number of ready records to keep in the pool.
+            rotate_at (time): The time of day in UTC to rotate the message at.
+            outlook_service_endpoint (Optional[str], optional): The URL of the EWS endpoint
+                to use instead of autodiscovering it. Defaults to None.
+            min_retry_delay (float, optional): The delay in seconds before retrying after
+                a failure. It doubles with every failure in a row. Defaults to 60.0.
+            max_retry_delay (float, optional): The maximum delay in seconds before
+                retrying after a failure. Defaults to 3600.0.
+        """
+        self._db = db
+        self._ai_config_path = ai_config_path
+        self._html_template_path = html_template_path
+        self._oof_data_dir = oof_data_dir
+        self._outlook_login_name = outlook_login_name
+        self._outlook_password = outlook_password
+        self._outlook_account_name = outlook_account_name
+        self._outlook_service_endpoint = outlook_service_endpoint
+        self._pool_size = pool_size
+        self._rotate_at = rotate_at
+        self._min_retry_delay = min_retry_delay
+        self._max_retry_delay = max_retry_delay
+
+    async def get_pool(self) -> List[AutoReplyRecord]:
+        """Returns the records that are ready to be published, oldest first."""
+        records = await self._db.get_all()
+        ready = [r for r in records if self._is_ready(record=r)]
+        return sorted(ready, key=lambda r: r.created_at)
+
+    async def fill_pool(self) -> List[AutoReplyRecord]:
+        """Finishes unfinished pool records and generates new ones until the pool is full.
+
+        Returns:
+            List[AutoReplyRecord]: The records that were added to the pool.
+        """
+        # Records left unfinished, e.g. by a restart, resume from their last stage
+        records = []
+        for record in await self._db.get_all():
+            if record.pooled and record.published_at is None:
+                if not self._is_ready(record=record):
+                    if await self._try_prepare(record=record):
+                        records.append(record)
+
+        n_missing = self._pool_size - len(await self.get_pool())
+        if n_missing <= 0:
+            return records
+
+        print(f"Generating {n_missing} records for the pool...")
+        # The outputs of the candidates are saved to their records, so the source
+        # generator gets a scratch directory instead of the directory of the config
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            source = AutoReplyContentGenerator(
+                config_file_path=self._ai_config_path,
+                output_dir=Path(scratch_dir),
+                verbose=True,
+            )
+            candidates = await source.generate_candidates(n_candidates=n_missing)
+
+        for candidate in candidates:
+            record = await self._db.create(
+                ai_config_path=self._ai_config_path,
+                html_template_path=self._html_template_path,
+            )
+            record.pooled = True
+            record.text = candidate.message
+            record.text_created_at = utcnow()
+            record.image_url = candidate.image_url
+            record.image_created_at = utcnow()
+            await self._db.save(record=record)
+            generator = AutoReplyContentGenerator(
+                config_file_path=record.ai_config_path,
+                output_dir=record.dir,
+                verbose=True,
+            )
+            try:
+                await generator.select_candidate(candidate=candidate)
+            except Exception as e:
+                print(
+                    f"ERROR. Failed to save outputs of {record.key}, removing it: {e!r}"
+                )
+                await self._db.delete(key=record.key)
+                continue
+            if await self._try_prepare(record=record):
+                records.append(record)
+        return records
+
+    async def prepare(self, record: AutoReplyRecord) -> None:
+        """Downloads, optimizes and renders the content of a record and adds it to the pool.
+
+        Args:
+            record (AutoReplyRecord): A record with a message and an image URL.
+        """
+        assert record.text is not None
+        assert record.image_url is not None
+
+        pipeline = self._create_pipeline(record=record)
+        await pipeline.run(targets=[STAGE_RENDER_HTML])
+        record.pooled = True
+        await self._db.save(record=record)
+
+    async def rotate(self) -> Optional[AutoReplyRecord]:
+        """Publishes the oldest record in the pool as the out-of-office message.
+
+        Returns:
+            Optional[AutoReplyRecord]: The published record, or None if the pool is empty.
+        """
+        pool = await self.get_pool()
+        if len(pool) == 0:
+            print("WARNING. The pool is empty. Keeping the current message.")
+            return None
+        record = pool[0]
+
+        pipeline = self._create_pipeline(record=record)
+        await pipeline.run(targets=[STAGE_PUBLISH])
+        if not pipeline.published:
+            # The record is the active message already, so it leaves the pool too
+            record.published_at = utcnow()
+            await self._db.save(record=record)
+        return record
+
+    async def run(self) -> None:
+        """Keeps the pool full and rotates the message every day until cancelled."""
+        next_rotation = self._get_next_rotation(now=utcnow())
+        retry_delay = self._min_retry_delay
+        while True:
+            failed = False
+            if utcnow() >= next_rotation:
+                try:
+                    await self.rotate()
+                    next_rotation = self._get_next_rotation(now=utcnow())
+                except Exception as e:
+                    print(f"ERROR. Failed to rotate the message: {e!r}")
+                    failed = True
+
+            try:
+                await self.fill_pool()
+            except Exception as e:
+                print(f"ERROR. Failed to fill the pool: {e!r}")
+                failed = True
+
+            delay = (next_rotation - utcnow()).total_seconds()
+            if failed:
+                delay = min(delay, retry_delay)
+                retry_delay = min(retry_delay * 2, self._max_retry_delay)
+                print(f"Retrying in {max(0.0, delay):.0f} seconds.")
+            else:
+                retry_delay = self._min_retry_delay
+                print(f"Next rotation in {delay / 3600:.1f} hours.")
+            get_tracer().write_counters()
+            await anyio.sleep(max(0.0, delay))
+
+    def _create_pipeline(self, record: AutoReplyRecord) -> AutoReplyPipeline:
+        return AutoReplyPipeline(
+            db=self._db,
+            record=record,
+            oof_data_dir=self._oof_data_dir,
+            outlook_login_name=self._outlook_login_name,
+            outlook_password=self._outlook_password,
+            outlook_account_name=self._outlook_account_name,
+            outlook_service_endpoint=self._outlook_service_endpoint,
+        )
+
+    async def _try_prepare(self, record: AutoReplyRecord) -> bool:
+        """Prepares a pool record, and removes it from the repository if that fails."""
+        try:
+            await self.prepare(record=record)
+            return True
+        except Exception as e:
+            print(f"ERROR. Failed to prepare record {record.key}, removing it: {e!r}")
+            await self._db.delete(key=record.key)
+            return False
+
+    def _get_next_rotation(self, now: datetime) -> datetime:
+        """Returns the next time to rotate the message at."""
+        next_rotation = datetime.combine(now.date(), self._rotate_at, tzinfo=now.tzinfo)
+        if next_rotation <= now:
+            next_rotation += timedelta(days=1)
+        return next_rotation
+
+    def _is_ready(self, record: AutoReplyRecord) -> bool:
+        """Checks whether a record is in the pool and ready to be published."""
+        return (
+            record.pooled
+            and record.published_at is None
+            and record.html_path is not None
+            and record.html_path.exists()
+            and record.text is not None
+            and record.original_image_path is not None
+            and record.optimized_image_path is not None
+        )
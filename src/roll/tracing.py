@@ -0,0 +1,302 @@
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, TypeVar, cast
+
+from pydantic import BaseModel, Field
+
+from roll.utils import utcnow
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_current_span_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_span_id", default=None
+)
+
+
+class Span(BaseModel):
+    """Represents a timed operation."""
+
+    name: str = Field(...)
+    """The name of the operation, e.g. `models.generate_image`."""
+
+    span_id: int = Field(...)
+    """The identifier of the span within its run."""
+
+    parent_id: Optional[int] = Field(default=None)
+    """The identifier of the span this span was started in, if any."""
+
+    started_at: datetime = Field(...)
+    """The date and time when the operation started."""
+
+    duration: float = Field(...)
+    """The duration of the operation in seconds."""
+
+    attributes: Dict[str, Any] = Field(default_factory=dict)
+    """Additional information about the operation, e.g. the prompt name."""
+
+    error: Optional[str] = Field(default=None)
+    """The error the operation failed with, if any."""
+
+
+class SpanSummary(BaseModel):
+    """Represents the timings of all spans with the same name."""
+
+    name: str = Field(...)
+    count: int = Field(...)
+    errors: int = Field(...)
+    total: float = Field(...)
+    p50: float = Field(...)
+    p95: float = Field(...)
+    max: float = Field(...)
+
+
+class Tracer:
+    """Represents a recorder of spans and counters.
+
+    Spans are kept in memory for summaries and, once a run is started with an
+    output path, appended to a JSONL trace file as they end. Spans may end in
+    worker threads, so recording is thread-safe.
+    """
+
+    def __init__(self, max_spans: int = 10000) -> None:
+        """Initializes a new instance of the Tracer class.
+
+        Args:
+            max_spans (int, optional): The maximum number of spans kept in memory.
+                The oldest spans are dropped first. Defaults to 10000.
+        """
+        self._spans: Deque[Span] = deque(maxlen=max_spans)
+        self._counters: Dict[str, int] = {}
+        self._output_path: Optional[Path] = None
+        self._span_ids = itertools.count(1)
+        self._written_counters: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def output_path(self) -> Optional[Path]:
+        return self._output_path
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def start_run(self, output_path: Optional[Path] = None) -> None:
+        """Clears the recorded spans and counters and starts a new run.
+
+        Args:
+            output_path (Optional[Path], optional): The JSONL file to write the spans
+                of the run to. Defaults to None.
+        """
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._span_ids = itertools.count(1)
+            self._written_counters = None
+            self._output_path = output_path
+        if output_path is not None:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def end_run(self) -> None:
+        """Writes the counters of the run to its trace file and closes the file.
+
+        Spans that end after the run are kept in memory only.
+        """
+        self.write_counters()
+        with self._lock:
+            self._output_path = None
+
+    def write_counters(self) -> None:
+        """Writes the current counters of the run to its trace file, if they changed.
+
+        Each counters entry holds the totals of the run so far, so the last entry
+        of a trace file holds the totals of the run.
+        """
+        counters = self.counters
+        with self._lock:
+            if counters == self._written_counters:
+                return
+            self._written_counters = counters
+        self._write({"type": "counters", "counters": counters})
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """Times the enclosed block.
+
+        Args:
+            name (str): The name of the operation.
+            **attributes (Any): Additional information about the operation.
+
+        Yields:
+            Dict[str, Any]: The attributes of the span, which the block can add to.
+        """
+        span_id = next(self._span_ids)
+        parent_id = _current_span_id.get()
+        token = _current_span_id.set(span_id)
+        started_at = utcnow()
+        started = time.perf_counter()
+        error: Optional[str] = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            try:
+                _current_span_id.reset(token)
+            except ValueError:
+                # Async generators can be closed from another context
+                pass
+            self._record(
+                Span(
+                    name=name,
+                    span_id=span_id,
+                    parent_id=parent_id,
+                    started_at=started_at,
+                    duration=duration,
+                    attributes=attributes,
+                    error=error,
+                )
+            )
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Adds a value to a counter.
+
+        Args:
+            name (str): The name of the counter, e.g. `cache.hits`.
+            value (int, optional): The value to add. Defaults to 1.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get_summary(self) -> List[SpanSummary]:
+        """Returns the timings of the recorded spans grouped by name."""
+        durations: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        for span in self.spans:
+            durations.setdefault(span.name, []).append(span.duration)
+            errors[span.name] = errors.get(span.name, 0) + (span.error is not None)
+
+        summary = []
+        for name, values in sorted(durations.items()):
+            values.sort()
+            summary.append(
+                SpanSummary(
+                    name=name,
+                    count=len(values),
+                    errors=errors[name],
+                    total=sum(values),
+                    p50=_percentile(values, 50),
+                    p95=_percentile(values, 95),
+                    max=values[-1],
+                )
+            )
+        return summary
+
+    def format_summary(self) -> str:
+        """Returns the timings and counters of the run as a text table."""
+        lines = [
+            f"{'span':<36} {'count':>6} {'errors':>6} {'total':>9} "
+            f"{'p50':>9} {'p95':>9} {'max':>9}"
+        ]
+        for s in self.get_summary():
+            lines.append(
+                f"{s.name:<36} {s.count:>6} {s.errors:>6} {s.total * 1000:>7.1f}ms "
+                f"{s.p50 * 1000:>7.1f}ms {s.p95 * 1000:>7.1f}ms {s.max * 1000:>7.1f}ms"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<36} {value:>6}")
+        return "\n".join(lines)
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+        self._write({"type": "span", **span.model_dump(mode="json")})
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        if self._output_path is None:
+            return
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self._output_path, "a") as file:
+                file.write(line)
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+tracer = Tracer()
+"""The tracer of the process, used when no other tracer is in use."""
+
+_current_tracer: contextvars.ContextVar[Optional[Tracer]] = contextvars.ContextVar(
+    "current_tracer", default=None
+)
+
+
+def get_tracer() -> Tracer:
+    """Returns the tracer in use in the current context."""
+    current = _current_tracer.get()
+    return tracer if current is None else current
+
+
+@contextmanager
+def use_tracer(current: Tracer) -> Iterator[Tracer]:
+    """Records the spans and counters of the enclosed block with the given tracer.
+
+    The tracer is passed on to tasks and worker threads started in the block, so
+    concurrent sessions in one process can each keep their own tracer.
+
+    Args:
+        current (Tracer): The tracer to use.
+    """
+    token = _current_tracer.set(current)
+    try:
+        yield current
+    finally:
+        _current_tracer.reset(token)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Times every call of the decorated function, sync or async, as a span.
+
+    Args:
+        name (str): The name of the span.
+    """
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with get_tracer().span(name):
+                    return await func(*args, **kwargs)
+
+            return cast(F, async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with get_tracer().span(name):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
@@ -1,68 +1,70 @@
+import sys
+from datetime import timedelta
 from pathlib import Path
+from typing import Optional
 
 import anyio
+from roll.cache import InferenceCache
 from roll.config import settings
-from roll.email import AutoReplyHtmlCreator, OutlookAutoReplyClient
-from roll.image import ImageOptimizer
-from roll.io import FileDownloader
-from roll.models import AutoReplyContentGenerator
+from roll.data import DataRepository
+from roll.pipeline import STAGE_PUBLISH, AutoReplyPipeline
+from roll.tracing import tracer
 from roll.utils import utcnow
 
 
-async def main() -> None:
-    run_id = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
-    output_dir = Path(f"data/cli-runs/{run_id}")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    config_file_path = Path("config/auto-reply-content-gen.aiconfig.json")
-    generator = AutoReplyContentGenerator(
-        config_file_path=config_file_path,
-        output_dir=output_dir,
-        verbose=True,
-    )
+async def main(run_key: Optional[str] = None) -> None:
+    """Generates and publishes an auto-reply message.
 
-    message = await generator.generate_message()
-    image_url = await generator.generate_image(auto_reply_message=message)
+    Args:
+        run_key (Optional[str], optional): The key of an earlier run to resume from its
+            last completed stage. Defaults to None.
+    """
+    db = DataRepository(data_dir=Path("data/cli-runs"))
+    if run_key is not None:
+        record = await db.get(key=run_key)
+        if record is None:
+            raise SystemExit(f"Run {run_key} not found.")
+        print(f"Resuming run {record.key} after {record.completed_stages}.")
+    else:
+        record = await db.create(
+            ai_config_path=Path("config/auto-reply-content-gen.aiconfig.json"),
+            html_template_path=Path("config/auto-reply-template.html"),
+        )
+        print(f"Starting run {record.key}.")
 
-    print(f"Generated image URL:\n{image_url}\n")
-
-    downloader = FileDownloader(output_dir=output_dir, verify_ssl=False, verbose=True)
+    inference_cache = None
+    if settings.INFERENCE_CACHE_DIR is not None:
+        inference_cache = InferenceCache(
+            cache_dir=settings.INFERENCE_CACHE_DIR,
+            ttl=timedelta(seconds=settings.INFERENCE_CACHE_TTL_SECONDS),
+            max_entries=settings.INFERENCE_CACHE_MAX_ENTRIES,
+        )
+    run_id = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    trace_path = record.dir / "traces" / f"{run_id}.jsonl"
+    tracer.start_run(output_path=trace_path)
+    pipeline = AutoReplyPipeline(
+        db=db,
+        record=record,
+        oof_data_dir=Path("data/oof"),
+        outlook_login_name=settings.LOGIN,
+        outlook_password=settings.PASSWORD,
+        outlook_account_name=settings.ACCOUNT_NAME,
+        outlook_service_endpoint=settings.OUTLOOK_SERVICE_ENDPOINT,
+        inference_cache=inference_cache,
+        on_message_token=lambda token: print(token, end="", flush=True),
+    )
     try:
-        img_path = await downloader.download_one(url=image_url)
+        await pipeline.run(targets=[STAGE_PUBLISH])
     finally:
-        await downloader.close()
-
-    optimizer = ImageOptimizer(max_width=512, quantize=False, image_quality=80)
-    img_optimized_path = optimizer.run(input_path=img_path)
-    print(f"Optimized image saved to {img_optimized_path}")
-
-    email_creator = AutoReplyHtmlCreator(
-        template_file_path=Path("config/auto-reply-template.html")
-    )
-    email_file_path = output_dir / "auto-reply.html"
-    email_text = await email_creator.run(
-        message=message,
-        image_file_path=img_optimized_path,
-        output_path=email_file_path,
-    )
-
-    print(f"Auto-reply email text:\n{email_text}\n")
-
-    outlook_old_settings_path = output_dir / "outlook-oof-settings-backup.json"
-    outlook_oof = OutlookAutoReplyClient(
-        login_name=settings.LOGIN,
-        password=settings.PASSWORD,
-        account_name=settings.ACCOUNT_NAME,
-    )
-    print(
-        f"Backing up Outlook's current out-of-office settings to {outlook_old_settings_path}..."
-    )
-    await outlook_oof.backup_to_json_file(output_path=outlook_old_settings_path)
-
-    print("Setting internal auto-reply message...")
-    await outlook_oof.set_internal_reply(html_content=email_text)
+        tracer.end_run()
+        print(f"\n\nTimings:\n{tracer.format_summary()}")
+        print(f"Trace saved to {trace_path}")
 
+    print(f"\nAuto-reply message:\n{record.text}\n")
+    print(f"Generated image URL:\n{record.image_url}\n")
+    print(f"Auto-reply email saved to {record.html_path}")
     print("Done.")
 
 
 if __name__ == "__main__":
-    anyio.run(main)
+    anyio.run(main, sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,34 @@
+from datetime import time
+from pathlib import Path
+
+import anyio
+from roll.config import settings
+from roll.data import DataRepository
+from roll.scheduler import AutoReplyScheduler
+from roll.tracing import tracer
+from roll.utils import utcnow
+
+
+async def main() -> None:
+    run_id = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    tracer.start_run(output_path=Path(f"data/traces/scheduler-{run_id}.jsonl"))
+    scheduler = AutoReplyScheduler(
+        db=DataRepository(data_dir=Path("data/repository")),
+        ai_config_path=Path("config/auto-reply-content-gen.aiconfig.json"),
+        html_template_path=Path("config/auto-reply-template.html"),
+        oof_data_dir=Path("data/oof"),
+        outlook_login_name=settings.LOGIN,
+        outlook_password=settings.PASSWORD,
+        outlook_account_name=settings.ACCOUNT_NAME,
+        outlook_service_endpoint=settings.OUTLOOK_SERVICE_ENDPOINT,
+        pool_size=7,
+        rotate_at=time(hour=5),
+    )
+    try:
+        await scheduler.run()
+    finally:
+        tracer.end_run()
+
+
+if __name__ == "__main__":
+    anyio.run(main)
@@ -1,16 +1,59 @@
+import math
+import time
+from datetime import timedelta
 from pathlib import Path
-from typing import cast
+from typing import Any, Callable, Dict, List, Optional, Set, cast
 
 import anyio
 import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
+from roll.cache import InferenceCache
 from roll.config import settings
-from roll.data import ActiveOutOfOfficeSetting, AutoReplyRecord, DataRepository
-from roll.email import AutoReplyHtmlCreator, OutlookAutoReplyClient
-from roll.image import ImageOptimizer
-from roll.io import FileDownloader
-from roll.models import AutoReplyContentGenerator
+from roll.data import AutoReplyRecord, DataRepository, RecordIndex
+from roll.jobs import JOB_FAILED, Job, JobQueue, JobWorkerPool
+from roll.models import AutoReplyCandidate, AutoReplyContentGenerator
+from roll.pipeline import (
+    STAGE_GENERATE_IMAGE,
+    STAGE_GENERATE_MESSAGE,
+    STAGE_OPTIMIZE_IMAGE,
+    STAGE_PUBLISH,
+    STAGE_RENDER_HTML,
+    AutoReplyPipeline,
+)
+from roll.tracing import Tracer, use_tracer
 from roll.utils import utcnow
 
+JOB_GENERATE_MESSAGE = "generate-message"
+JOB_GENERATE_IMAGE = "generate-image"
+JOB_PREPARE_IMAGE = "prepare-image"
+JOB_SET_OUT_OF_OFFICE = "set-out-of-office"
+JOB_LABELS = {
+    JOB_GENERATE_MESSAGE: "Generating message",
+    JOB_GENERATE_IMAGE: "Generating image",
+    JOB_PREPARE_IMAGE: "Downloading image",
+    JOB_SET_OUT_OF_OFFICE: "Setting out-of-office",
+}
+
+
+@st.cache_resource
+def get_repository(data_dir: Path) -> DataRepository:
+    """Return the repository, which is shared by all sessions of the app."""
+    return DataRepository(data_dir=data_dir)
+
+
+@st.cache_resource
+def get_record_index(data_dir: Path) -> RecordIndex:
+    """Return the listing of the records, which is shared by all sessions of the app."""
+    return RecordIndex(db=get_repository(data_dir=data_dir))
+
+
+@st.cache_resource
+def get_job_worker_pool(_app: "StreamlitApp") -> JobWorkerPool:
+    """Start the job workers, which are shared by all sessions of the app."""
+    pool = _app.create_job_worker_pool()
+    pool.start()
+    return pool
+
 
 class StreamlitApp:
     def __init__(
@@ -19,17 +62,37 @@ class StreamlitApp:
         ai_config_path: Path,
         html_template_file_path: Path,
         oof_data_dir: Path,
+        jobs_dir: Path,
         outlook_login_name: str,
         outlook_password: str,
         outlook_account_name: str,
+        outlook_service_endpoint: Optional[str] = None,
+        inference_cache: Optional[InferenceCache] = None,
+        n_candidates: int = 3,
+        trace_dir: Optional[Path] = None,
+        n_job_workers: int = 2,
+        sidebar_page_size: int = 20,
+        autosave_delay: float = 3.0,
+        poll_interval: float = 0.5,
     ) -> None:
-        self._db = DataRepository(data_dir=data_dir)
+        self._db = get_repository(data_dir=data_dir)
+        self._index = get_record_index(data_dir=data_dir)
         self._ai_config_path = ai_config_path
         self._html_template_file_path = html_template_file_path
         self._oof_data_dir = oof_data_dir
+        self._jobs_dir = jobs_dir
         self._outlook_login_name = outlook_login_name
         self._outlook_password = outlook_password
         self._outlook_account_name = outlook_account_name
+        self._outlook_service_endpoint = outlook_service_endpoint
+        self._inference_cache = inference_cache
+        self._n_candidates = n_candidates
+        self._trace_dir = trace_dir
+        self._n_job_workers = n_job_workers
+        self._sidebar_page_size = sidebar_page_size
+        self._autosave_delay = autosave_delay
+        self._poll_interval = poll_interval
+        self._jobs: Optional[JobWorkerPool] = None
 
     @property
     def current_key(self) -> str:
@@ -41,10 +104,75 @@ class StreamlitApp:
         """Set the current key."""
         st.session_state["current_key"] = value
 
+    @property
+    def sidebar_page(self) -> int:
+        """Return the page of records shown on the sidebar."""
+        if "sidebar_page" not in st.session_state:
+            st.session_state["sidebar_page"] = 0
+        return cast(int, st.session_state["sidebar_page"])
+
+    @sidebar_page.setter
+    def sidebar_page(self, value: int) -> None:
+        """Set the page of records shown on the sidebar."""
+        st.session_state["sidebar_page"] = value
+
+    @property
+    def draft(self) -> Optional[AutoReplyRecord]:
+        """Return the current record with edits that are not saved yet, if any."""
+        return cast(Optional[AutoReplyRecord], st.session_state.get("draft"))
+
+    @property
+    def candidates(self) -> Dict[str, List[AutoReplyCandidate]]:
+        """Return the generated candidates by record key."""
+        if "candidates" not in st.session_state:
+            st.session_state["candidates"] = {}
+        return cast(Dict[str, List[AutoReplyCandidate]], st.session_state["candidates"])
+
+    @property
+    def submitted_jobs(self) -> Set[str]:
+        """Return the identifiers of the jobs submitted by the session."""
+        if "submitted_jobs" not in st.session_state:
+            st.session_state["submitted_jobs"] = set()
+        return cast(Set[str], st.session_state["submitted_jobs"])
+
+    @property
+    def jobs(self) -> JobWorkerPool:
+        """Return the job workers."""
+        assert self._jobs is not None
+        return self._jobs
+
+    def create_job_worker_pool(self) -> JobWorkerPool:
+        """Create the workers that run the jobs of the app."""
+        return JobWorkerPool(
+            queue=JobQueue(jobs_dir=self._jobs_dir),
+            db=self._db,
+            handler=self._run_job,
+            n_workers=self._n_job_workers,
+        )
+
+    @property
+    def tracer(self) -> Tracer:
+        """Return the tracer of the session, which writes to its own trace file."""
+        if "tracer" not in st.session_state:
+            tracer = Tracer()
+            output_path = None
+            if self._trace_dir is not None:
+                run_id = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
+                output_path = self._trace_dir / f"ui-{run_id}.jsonl"
+            tracer.start_run(output_path=output_path)
+            st.session_state["tracer"] = tracer
+        return cast(Tracer, st.session_state["tracer"])
+
     async def run(self) -> None:
         await self._setup_page_config()
-        await self._build_sidebar()
-        await self._build_main_content()
+        with use_tracer(self.tracer):
+            self._jobs = get_job_worker_pool(self)
+            await self._autosave()
+            await self._build_sidebar()
+            await self._build_main_content()
+            await self._build_diagnostics()
+            self.tracer.write_counters()
+            self._schedule_reruns()
 
     async def _setup_page_config(self) -> None:
         """Set up any app settings, if any."""
@@ -55,6 +183,39 @@ class StreamlitApp:
             initial_sidebar_state="expanded",
         )
 
+    async def _build_diagnostics(self) -> None:
+        """Build the diagnostics panel with the timings of the session."""
+        with st.sidebar.expander(label="Diagnostics"):
+            summary = self.tracer.get_summary()
+            if len(summary) == 0:
+                st.write("Nothing timed yet.")
+            else:
+                st.dataframe(
+                    [
+                        {
+                            "span": s.name,
+                            "count": s.count,
+                            "errors": s.errors,
+                            "total (ms)": round(s.total * 1000, 1),
+                            "p50 (ms)": round(s.p50 * 1000, 1),
+                            "p95 (ms)": round(s.p95 * 1000, 1),
+                            "max (ms)": round(s.max * 1000, 1),
+                        }
+                        for s in summary
+                    ],
+                    hide_index=True,
+                    use_container_width=True,
+                )
+            counters = self.tracer.counters
+            if len(counters) > 0:
+                st.dataframe(
+                    [{"counter": k, "value": v} for k, v in sorted(counters.items())],
+                    hide_index=True,
+                    use_container_width=True,
+                )
+            if self.tracer.output_path is not None:
+                st.caption(f"Trace: {self.tracer.output_path}")
+
     async def _build_sidebar(self) -> None:
         """Build the sidebar of the app."""
 
@@ -63,45 +224,79 @@ class StreamlitApp:
         ):
             await self._create_new_content()
 
-        records = await self._db.get_all()
-        if len(records) > 0:
-            for record in records:
-                cols = st.sidebar.columns(spec=[0.65, 0.25, 0.1])
-                n_word_count = 0
-                # created_ts = record.created_at.strftime("%Y-%m-%d %H:%M")
-                if record.text is not None:
-                    n_word_count = len(record.text.split())
-                    cols[0].write(f"Message has {n_word_count} words")
-                else:
-                    cols[0].write("Message not generated yet.")
-                if record.optimized_image_path is not None:
-                    cols[1].image(str(record.optimized_image_path), width=65)
-                else:
-                    cols[1].write("❌")
-                if cols[2].button(label="✏️", key=record.key, use_container_width=True):
-                    self.current_key = record.key
+        await self._index.refresh()
+        n_pages = max(1, math.ceil(len(self._index) / self._sidebar_page_size))
+        self.sidebar_page = min(self.sidebar_page, n_pages - 1)
+        if n_pages > 1:
+            cols = st.sidebar.columns(spec=[0.2, 0.6, 0.2])
+            if cols[0].button(
+                label="◀", disabled=self.sidebar_page == 0, use_container_width=True
+            ):
+                self.sidebar_page -= 1
+            if cols[2].button(
+                label="▶",
+                disabled=self.sidebar_page == n_pages - 1,
+                use_container_width=True,
+            ):
+                self.sidebar_page += 1
+            cols[1].caption(f"Page {self.sidebar_page + 1} of {n_pages}")
+
+        summaries = await self._index.get_page(
+            offset=self.sidebar_page * self._sidebar_page_size,
+            limit=self._sidebar_page_size,
+        )
+        for summary in summaries:
+            cols = st.sidebar.columns(spec=[0.65, 0.25, 0.1])
+            busy = "" if self.jobs.queue.get_active(summary.key) is None else " ⏳"
+            if summary.n_words is not None:
+                cols[0].write(f"Message has {summary.n_words} words{busy}")
+            else:
+                cols[0].write(f"Message not generated yet.{busy}")
+            if summary.optimized_image_path is not None:
+                cols[1].image(str(summary.optimized_image_path), width=65)
+            else:
+                cols[1].write("❌")
+            if cols[2].button(label="✏️", key=summary.key, use_container_width=True):
+                await self._save_draft()
+                self.current_key = summary.key
 
     async def _build_main_content(self) -> None:
         """Build the main content of the app."""
         st.header("🥐 Roll: Auto Reply Content Generator", anchor=False)
 
-        rec = await self._db.get(key=self.current_key)
+        rec = self.draft
+        if rec is None or rec.key != self.current_key:
+            rec = await self._db.get(key=self.current_key)
 
         if rec is None:
             st.write("Please select a record on the sidebar or create a new record.")
         else:
-            await self._render_navbar(record=rec)
-
-            msg = "" if rec.text is None else rec.text
-
+            await self._notify_finished_jobs(record=rec)
+            job = self.jobs.queue.get_active(record_key=rec.key)
+            navbar = st.container(border=True)
             col_left, col_right = st.columns(spec=[0.5, 0.5], gap="small")
+
             with col_left:
-                rec.text = st.text_area(label="Message", value=msg, height=500)
-                if rec.text != msg:
-                    if rec.text_created_at is None:
-                        rec.text_created_at = utcnow()
-                    await self._db.save(record=rec)
-                    st.toast("Message updated.")
+                if job is not None and job.progress is not None:
+                    st.text(job.progress)
+                else:
+                    # The key changes when the message is replaced, e.g. by a job,
+                    # so that the editor shows the new message
+                    created_at = rec.text_created_at
+                    revision = "new" if created_at is None else created_at.timestamp()
+                    widget_key = f"message-{rec.key}-{revision}"
+                    st.text_area(
+                        label="Message",
+                        value="" if rec.text is None else rec.text,
+                        height=500,
+                        disabled=job is not None,
+                        key=widget_key,
+                        on_change=self._on_message_change,
+                        args=(rec, widget_key),
+                    )
+                    if self.draft is not None:
+                        st.caption("Unsaved changes are saved automatically.")
+            await self._render_navbar(navbar=navbar, record=rec, job=job)
             with col_right:
                 st.write("Image")
                 if rec.optimized_image_path is not None:
@@ -109,163 +304,325 @@ class StreamlitApp:
                 else:
                     st.write("No image yet.")
 
-    async def _render_navbar(self, record: AutoReplyRecord) -> None:
-        with st.container(border=True):
-            col1, col2, col3, col4 = st.columns(spec=4)
+            await self._render_candidates(record=rec)
+
+    async def _render_navbar(
+        self,
+        navbar: DeltaGenerator,
+        record: AutoReplyRecord,
+        job: Optional[Job],
+    ) -> None:
+        busy = job is not None
+        with navbar:
+            col1, col2, col3, col4, col5 = st.columns(spec=5)
+            force = col5.checkbox(
+                label="Force update",
+                help="Write the out-of-office settings even if they are unchanged.",
+            )
 
-            if col1.button(label="Save content", use_container_width=True):
-                await self._db.save(record=record)
+            if col1.button(
+                label="Save content", use_container_width=True, disabled=busy
+            ):
+                await self._save_draft()
                 st.toast("Content saved.", icon="✅")
 
-            if col2.button(label="Generate message", use_container_width=True):
-                await self._generate_message(record=record)
+            if col2.button(
+                label="Generate message", use_container_width=True, disabled=busy
+            ):
+                await self._submit_job(record=record, kind=JOB_GENERATE_MESSAGE)
 
-            if col3.button(label="Generate image", use_container_width=True):
+            if col3.button(
+                label="Generate image", use_container_width=True, disabled=busy
+            ):
                 if record.text is None:
                     st.toast("Please generate message first.", icon="⚠️")
                 else:
-                    await self._generate_image(record=record)
+                    await self._submit_job(record=record, kind=JOB_GENERATE_IMAGE)
 
-            if col4.button(label="Set out-of-office", use_container_width=True):
+            if col4.button(
+                label="Generate candidates", use_container_width=True, disabled=busy
+            ):
+                await self._generate_candidates(record=record)
+
+            if col5.button(
+                label="Set out-of-office", use_container_width=True, disabled=busy
+            ):
                 if record.text is None:
                     st.toast("Please generate message first.", icon="⚠️")
-                elif record.optimized_image_path is None:
+                elif not self._has_image(record=record):
                     st.toast("Please generate image first.", icon="⚠️")
                 else:
-                    await self._set_out_of_office(record=record)
+                    await self._set_out_of_office(record=record, force=force)
+
+            if job is not None:
+                st.caption(f"{JOB_LABELS.get(job.kind, job.kind)}... ({job.status})")
 
     async def _create_new_content(self) -> None:
         """Create a new record."""
+        await self._save_draft()
         new_record = await self._db.create(
             ai_config_path=self._ai_config_path,
             html_template_path=self._html_template_file_path,
         )
         self.current_key = new_record.key
+        self.sidebar_page = 0
 
-    async def _generate_message(self, record: AutoReplyRecord) -> None:
-        """Generate message."""
+    def _create_pipeline(
+        self,
+        record: AutoReplyRecord,
+        force_publish: bool = False,
+        on_message_token: Optional[Callable[[str], None]] = None,
+    ) -> AutoReplyPipeline:
+        """Create a pipeline for the given record."""
+        return AutoReplyPipeline(
+            db=self._db,
+            record=record,
+            oof_data_dir=self._oof_data_dir,
+            outlook_login_name=self._outlook_login_name,
+            outlook_password=self._outlook_password,
+            outlook_account_name=self._outlook_account_name,
+            outlook_service_endpoint=self._outlook_service_endpoint,
+            inference_cache=self._inference_cache,
+            force_publish=force_publish,
+            on_message_token=on_message_token,
+        )
 
+    async def _submit_job(
+        self,
+        record: AutoReplyRecord,
+        kind: str,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Queue a job on the record and show its progress."""
+        await self._save_draft()
+        job = await self.jobs.submit(record_key=record.key, kind=kind, params=params)
+        self.submitted_jobs.add(job.job_id)
+        st.rerun()
+
+    async def _run_job(self, job: Job, record: AutoReplyRecord) -> Optional[str]:
+        """Run a job. This runs on the thread of the job workers."""
+        if job.kind == JOB_GENERATE_MESSAGE:
+            tokens: List[str] = []
+
+            def show_token(token: str) -> None:
+                tokens.append(token)
+                self.jobs.queue.set_progress(
+                    job_id=job.job_id, progress="".join(tokens)
+                )
+
+            pipeline = self._create_pipeline(record=record, on_message_token=show_token)
+            await pipeline.run(
+                targets=[STAGE_GENERATE_MESSAGE], rerun=[STAGE_GENERATE_MESSAGE]
+            )
+            return "Message generated."
+
+        if job.kind == JOB_GENERATE_IMAGE:
+            pipeline = self._create_pipeline(record=record)
+            await pipeline.run(
+                targets=[STAGE_OPTIMIZE_IMAGE], rerun=[STAGE_GENERATE_IMAGE]
+            )
+            return "Image generated."
+
+        if job.kind == JOB_PREPARE_IMAGE:
+            pipeline = self._create_pipeline(record=record)
+            await pipeline.run(targets=[STAGE_OPTIMIZE_IMAGE])
+            return "Image downloaded."
+
+        if job.kind == JOB_SET_OUT_OF_OFFICE:
+            # Publishing must not generate an image that nobody has seen
+            if not self._has_image(record=record):
+                raise ValueError("The image is outdated. Please generate image first.")
+            pipeline = self._create_pipeline(
+                record=record, force_publish=bool(job.params.get("force"))
+            )
+            await pipeline.run(targets=[STAGE_PUBLISH])
+            if not pipeline.published:
+                return "Out-of-office message is already active."
+            return "Out-of-office message set succesfully"
+
+        raise ValueError(f"Unknown job kind {job.kind}")
+
+    def _on_message_change(self, record: AutoReplyRecord, widget_key: str) -> None:
+        """Keep the edited message as a draft.
+
+        Streamlit calls this before the next run of the script, so buttons that
+        were clicked together with the edit, e.g. in the sidebar, see the draft.
+        """
+        record.text = st.session_state[widget_key]
+        if record.text_created_at is None:
+            record.text_created_at = utcnow()
+        # The message is now complete, but the rendered HTML is outdated
+        record.completed_stages = AutoReplyPipeline.get_completed_stages(record=record)
+        if STAGE_GENERATE_MESSAGE not in record.completed_stages:
+            record.completed_stages.insert(0, STAGE_GENERATE_MESSAGE)
+        AutoReplyPipeline.invalidate(record=record, stages=[STAGE_RENDER_HTML])
+        self._edit_draft(record=record)
+
+    def _edit_draft(self, record: AutoReplyRecord) -> None:
+        """Keep the edited record until it is saved, and restart the autosave delay."""
+        if record.is_dirty:
+            st.session_state["draft"] = record
+            st.session_state["draft_edited_at"] = time.monotonic()
+        else:
+            st.session_state.pop("draft", None)
+
+    async def _save_draft(self) -> None:
+        """Save the edits of the current record, if any."""
+        draft = st.session_state.pop("draft", None)
+        if draft is not None:
+            await self._db.save(record=draft)
+
+    def _is_autosave_due(self) -> bool:
+        """Return whether the message has not been edited for a while."""
+        edited_at = st.session_state.get("draft_edited_at", 0.0)
+        return time.monotonic() - edited_at >= self._autosave_delay
+
+    async def _autosave(self) -> None:
+        """Save the edits once the message has not been edited for a while."""
+        if self._is_autosave_due():
+            await self._save_draft()
+
+    async def _notify_finished_jobs(self, record: AutoReplyRecord) -> None:
+        """Show the outcome of the jobs the session submitted on the record."""
+        for job in self.jobs.queue.get_for_record(record_key=record.key):
+            if job.is_active or job.job_id not in self.submitted_jobs:
+                continue
+            self.submitted_jobs.discard(job.job_id)
+            if job.status == JOB_FAILED:
+                st.toast(f"{JOB_LABELS.get(job.kind)} failed: {job.error}", icon="❌")
+            elif job.result is not None:
+                st.toast(job.result, icon="✅")
+
+    def _schedule_reruns(self) -> None:
+        """Rerun the app while the current record has a job in flight, and when the
+        edits are due to be saved.
+
+        The checks run in a fragment on a timer, so the app stays responsive in the
+        meantime. Any interaction with the app starts a new run, so the autosave
+        delay restarts whenever the message is edited again.
+        """
+
+        def is_rerun_due() -> bool:
+            if self.jobs.queue.get_active(record_key=self.current_key) is not None:
+                return True
+            return self.draft is not None and self._is_autosave_due()
+
+        if self.draft is None and not is_rerun_due():
+            return
+
+        def check() -> None:
+            if is_rerun_due():
+                st.rerun()
+
+        st.fragment(check, run_every=self._poll_interval)()
+
+    async def _generate_candidates(self, record: AutoReplyRecord) -> None:
+        """Generate several messages with images for the user to pick from."""
+
+        await self._save_draft()
         generator = AutoReplyContentGenerator(
             config_file_path=record.ai_config_path,
             output_dir=record.dir,
             verbose=True,
         )
+        with st.spinner(f"Generating {self._n_candidates} candidates..."):
+            candidates = await generator.generate_candidates(
+                n_candidates=self._n_candidates
+            )
+        self.candidates[record.key] = candidates
 
-        message = await generator.generate_message()
-        record.text = message
-        record.text_created_at = utcnow()
-        await self._db.save(record=record)
+    async def _render_candidates(self, record: AutoReplyRecord) -> None:
+        """Render the generated candidates of a record, if any."""
+        candidates = self.candidates.get(record.key, [])
+        if len(candidates) == 0:
+            return
 
-    async def _generate_image(self, record: AutoReplyRecord) -> None:
-        """Generate image."""
+        st.subheader("Candidates", anchor=False)
+        cols = st.columns(spec=len(candidates), gap="small")
+        for index, (col, candidate) in enumerate(zip(cols, candidates)):
+            with col.container(border=True):
+                st.image(candidate.image_url)
+                st.text(candidate.message)
+                if st.button(
+                    label="Use this",
+                    key=f"use-candidate-{index}",
+                    use_container_width=True,
+                ):
+                    await self._use_candidate(record=record, candidate=candidate)
+                    st.rerun()
+
+    async def _use_candidate(
+        self, record: AutoReplyRecord, candidate: AutoReplyCandidate
+    ) -> None:
+        """Use the given candidate as the content of the record."""
 
         generator = AutoReplyContentGenerator(
             config_file_path=record.ai_config_path,
             output_dir=record.dir,
             verbose=True,
         )
+        await generator.select_candidate(candidate=candidate)
 
-        # Generate image
-        auto_reply_message = record.text
-        assert auto_reply_message is not None
-        image_url = await generator.generate_image(
-            auto_reply_message=auto_reply_message,
-        )
-        record.image_url = image_url
+        record.text = candidate.message
+        record.text_created_at = utcnow()
+        record.image_url = candidate.image_url
         record.image_created_at = utcnow()
+        record.completed_stages = [STAGE_GENERATE_MESSAGE, STAGE_GENERATE_IMAGE]
         await self._db.save(record=record)
 
-        # Download image
-        downloader = FileDownloader(
-            output_dir=record.dir, verify_ssl=False, verbose=True
+        del self.candidates[record.key]
+        await self._submit_job(record=record, kind=JOB_PREPARE_IMAGE)
+
+    @staticmethod
+    def _has_image(record: AutoReplyRecord) -> bool:
+        """Return whether the image of the record is up to date with its message."""
+        return STAGE_OPTIMIZE_IMAGE in AutoReplyPipeline.get_completed_stages(
+            record=record
         )
-        try:
-            img_path = await downloader.download_one(url=image_url)
-        finally:
-            await downloader.close()
-        record.original_image_path = img_path
-        await self._db.save(record=record)
 
-        # Optimize image
-        optimizer = ImageOptimizer(max_width=512, quantize=False, image_quality=80)
-        img_optimized_path = optimizer.run(input_path=img_path)
-        record.optimized_image_path = img_optimized_path
-        await self._db.save(record=record)
+    async def _set_out_of_office(
+        self, record: AutoReplyRecord, force: bool = False
+    ) -> None:
+        """Set out-of-office.
 
-    async def _set_out_of_office(self, record: AutoReplyRecord) -> None:
-        """Set out-of-office."""
+        Nothing is sent to Outlook if the same settings are already active,
+        unless `force` is set.
+        """
 
         if record.text is None:
             st.toast("Please generate message first.", icon="⚠️")
             return
 
-        if record.optimized_image_path is None:
+        if not self._has_image(record=record):
             st.toast("Please generate image first.", icon="⚠️")
             return
 
-        # Create email body
-        email_creator = AutoReplyHtmlCreator(
-            template_file_path=self._html_template_file_path
-        )
-        email_file_path = record.dir / "auto-reply.html"
-        assert record.text is not None
-        assert record.optimized_image_path is not None
-        email_text = await email_creator.run(
-            message=record.text,
-            image_file_path=record.optimized_image_path,
-            output_path=email_file_path,
+        await self._submit_job(
+            record=record, kind=JOB_SET_OUT_OF_OFFICE, params={"force": force}
         )
-        print(f"Auto-reply email text:\n{email_text}\n")
-
-        # Backup current out-of-office settings before setting new one
-        utcnow_str = utcnow().strftime("%Y-%m-%d_%H-%M-%S-%f")
-        outlook_old_settings_path = (
-            self._oof_data_dir / "backups" / f"{utcnow_str}-outlook-oof.json"
-        )
-        outlook_old_settings_path.parent.mkdir(parents=True, exist_ok=True)
-        outlook_oof = OutlookAutoReplyClient(
-            login_name=self._outlook_login_name,
-            password=self._outlook_password,
-            account_name=self._outlook_account_name,
-        )
-        print(
-            (
-                f"Backing up Outlook's current out-of-office settings to "
-                f"{outlook_old_settings_path}..."
-            )
-        )
-        await outlook_oof.backup_to_json_file(output_path=outlook_old_settings_path)
-
-        # Set new out-of-office settings
-        print("Setting internal auto-reply message...")
-        await outlook_oof.set_internal_reply(html_content=email_text)
-
-        # Save current out-of-office settings
-        active_oof = ActiveOutOfOfficeSetting(
-            created_at=utcnow(),
-            record_key=record.key,
-            generated_message=record.text,
-            original_generated_image_path=record.original_image_path,
-            optimized_generated_image_path=record.optimized_image_path,
-            email_text=email_text,
-            outlook_old_settings_path=outlook_old_settings_path,
-        )
-        await active_oof.save(output_dir=self._oof_data_dir)
-
-        # Done
-        st.toast("Out-of-office message set succesfully", icon="✅")
 
 
 async def main() -> None:
     """Main entry point of the UI."""
+    inference_cache = None
+    if settings.INFERENCE_CACHE_DIR is not None:
+        inference_cache = InferenceCache(
+            cache_dir=settings.INFERENCE_CACHE_DIR,
+            ttl=timedelta(seconds=settings.INFERENCE_CACHE_TTL_SECONDS),
+            max_entries=settings.INFERENCE_CACHE_MAX_ENTRIES,
+        )
     app = StreamlitApp(
         data_dir=Path("data/repository"),
         ai_config_path=Path("config/auto-reply-content-gen.aiconfig.json"),
         html_template_file_path=Path("config/auto-reply-template.html"),
         oof_data_dir=Path("data/oof"),
+        jobs_dir=Path("data/jobs"),
         outlook_login_name=settings.LOGIN,
         outlook_password=settings.PASSWORD,
         outlook_account_name=settings.ACCOUNT_NAME,
+        outlook_service_endpoint=settings.OUTLOOK_SERVICE_ENDPOINT,
+        inference_cache=inference_cache,
+        trace_dir=Path("data/traces"),
     )
     await app.run()
 